@@ -1,47 +1,74 @@
 from dotenv import load_dotenv
 load_dotenv()
+import gc
 import os
+import math
+import time
 import logging
 import asyncio
-
-# محاولة استيراد nest_asyncio لتجنب مشكلة "This event loop is already running"
-try:
-    import nest_asyncio
-    nest_asyncio.apply()
-except ImportError:
-    print("WARNING: يُفضل تثبيت مكتبة nest_asyncio عبر 'pip install nest_asyncio' لتجنب مشاكل حلقة الأحداث.")
+import signal
 
 from telegram import Update, BotCommand
 from telegram.ext import (
     ApplicationBuilder,
+    ChatMemberHandler,
     CommandHandler,
     MessageHandler,
     ConversationHandler,
     ContextTypes,
     filters
 )
-from tradingview_ta import TA_Handler, Interval
+import metrics
 from keep_alive import keep_alive
+from alert_store import AlertStore
+from cache import TTLCache
+from symbol_catalog import SymbolCatalog
+from storage import Storage
+from notifier import NotificationDispatcher, MAX_MESSAGE_LENGTH
+from update_processor import PerUserUpdateProcessor
+from conditions import ConditionError, compile_condition
+from market_data import AsyncFetcher, SymbolResolver, ticker_of
+from price_engine import PriceEngine
+from workers import WorkerPool, PRICE_WORKERS
 
-# إعداد logging للتصحيح
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO
-)
 logger = logging.getLogger(__name__)
 
 # تحميل التوكن من ملف البيئة
 TOKEN = os.getenv("TELEGRAM_TOKEN")
 
+# --- وضع الـ webhook ---
+# عند ضبط WEBHOOK_URL (العنوان العام للخادم) يستقبل البوت التحديثات عبر webhook بدلاً من polling
+WEBHOOK_URL = os.getenv("WEBHOOK_URL", "").rstrip("/")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET") or None
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv("WEBHOOK_MAX_CONNECTIONS", "40"))
+# عدد التحديثات التي تُعالج في نفس الوقت (تحديثات المستخدم الواحد تبقى بالترتيب)
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "16"))
+
 # --- إعدادات القناة والدعوات ---
 CHANNEL_USERNAME = "@Hermes_133"  # ضع اسم القناة بصيغة @username
 REFERRAL_BASE = "https://t.me/Hermes_133_Alert_bot?start="  # رابط الدعوة (يُضاف إليه معرف المستخدم)
 REQUIRED_INVITES = 0  # عدد الدعوات المطلوبة (استخدم 0 للسماح بالاستخدام الفوري)
 
-# القواميس لتسجيل بيانات الدعوات في الذاكرة:
+# ذاكرة عضوية القناة: مدة صلاحية النتيجة للأعضاء ولغير الأعضاء (بالثواني) والحجم الأقصى
+MEMBERSHIP_TTL = float(os.getenv("MEMBERSHIP_TTL", "900"))
+MEMBERSHIP_NEGATIVE_TTL = float(os.getenv("MEMBERSHIP_NEGATIVE_TTL", "30"))
+MEMBERSHIP_CACHE_SIZE = int(os.getenv("MEMBERSHIP_CACHE_SIZE", "100000"))
+# عند فشل get_chat_member: السماح للمستخدم بالمتابعة (true) أو رفضه (false)
+MEMBERSHIP_FAIL_OPEN = os.getenv("MEMBERSHIP_FAIL_OPEN", "false").lower() in ("1", "true", "yes")
+MEMBER_STATUSES = ['creator', 'administrator', 'member']
+
+# القواميس لتسجيل بيانات الدعوات في الذاكرة (تُحمّل من قاعدة البيانات عند التشغيل):
 invited_users = {}   # المستدعى -> referrer
 referrals = {}       # referrer -> مجموعة من المستدعى
 
+# --------------------
+# الخدمات: تُنشأ في init_services() عند التشغيل فقط. عمليات الفحص (spawn) تعيد استيراد هذا الملف
+# كـ __mp_main__، فلا يجب أن ينشئ استيراده تخزيناً أو طبقة جلب أو عمليات أو طابور إرسال.
+# --------------------
+# التخزين الدائم للتنبيهات والدعوات وعداد التنبيهات (SQLite)
+storage = None
+
 # --------------------
 # إعدادات التنبيهات والاختيارات
 # --------------------
@@ -68,10 +95,79 @@ EXCHANGE_OPTIONS = {
     "13": "MEXC"
 }
 
-alerts = {}
-alert_counter = 1  # عداد للتنبيهات الفريدة
+# التنبيهات في أعمدة مضغوطة (alerts.get(alert_id) يعيد التنبيه كقاموس)
+alerts = AlertStore()
+# أرقام التنبيهات تُحجز من قاعدة البيانات عبر storage.next_alert_id()
+# تنبيهات الشروط (/when): alert_id -> قاموس بنفس أعمدة جدول condition_alerts
+condition_alerts = {}
+# أرقام تنبيهات كل مستخدم (بالنوعين) لعرضها عبر /alerts دون المرور على كل التنبيهات
+user_alerts = {}
+# الحد الأقصى لعدد الأسطر في رسالة /alerts_add واحدة
+MAX_BULK_ALERTS = 100
+
+SCHEDULER_TICK = 2  # كل كم ثانية نبحث عن الأدوات المستحقة للفحص (أو نقرأ أحداث عمليات الفحص)
+# مهمة فحص الأسعار (انظر run_price_checks)
+price_checks = None
+
+# طبقة جلب الأسعار غير المتزامنة (لا توقف حلقة الأحداث أثناء طلبات TradingView)
+fetcher = None
+# ذاكرة مشتركة للتحقق من الرموز (تتجنب تكرار نفس الطلبات لنفس الرموز بين المستخدمين)
+resolver = None
+
+# محرك فحص الأسعار (الفهارس والجدولة وتتبع الفشل): داخل هذه العملية، أو موزعاً على
+# PRICE_WORKERS عملية منفصلة. في الحالتين تصل التنبيهات المفعّلة كأحداث إلى check_prices.
+# عدد العمليات يمكن تغييره أثناء التشغيل بالإشارتين SIGUSR1 و SIGUSR2 (انظر resize_workers).
+engine = None
+# آخر ملخص دورة من كل عملية فحص (للمقاييس)
+engine_stats = {}
+
+# قائمة الرموز المحلية للبحث الفوري (تُحمّل من قاعدة البيانات وتُحدّث دورياً في الخلفية)
+symbol_catalog = SymbolCatalog()
+CATALOG_REFRESH_INTERVAL = 6 * 3600  # فترة تحديث قائمة الرموز (بالثواني)
 
-CHECK_INTERVAL = 29  # فترة فحص الأسعار (بالثواني)
+# الحد الأقصى لعدد النتائج المعروضة عند البحث عن رمز في كل الخيارات
+MAX_SEARCH_RESULTS = 10
+
+# طابور إرسال التنبيهات المفعّلة (يحترم حدود Telegram ويدمج تنبيهات نفس الدردشة)
+dispatcher = None
+
+def init_services():
+    """
+    إنشاء الخدمات قبل التشغيل (تُستدعى من main، أو من benchmark.py).
+    """
+    global storage, fetcher, resolver, engine, dispatcher
+    storage = Storage()
+    fetcher = AsyncFetcher()
+    resolver = SymbolResolver(fetcher)
+    if PRICE_WORKERS > 1:
+        engine = WorkerPool(PRICE_WORKERS, source=engine_source)
+    else:
+        engine = PriceEngine(fetcher=fetcher, resolver=resolver)
+    dispatcher = NotificationDispatcher()
+
+# مقاييس تُقرأ من الحالة الحالية عند كل طلب لـ /metrics
+metrics.ALERTS.set_function(lambda: len(alerts))
+metrics.CONDITION_ALERTS.set_function(lambda: len(condition_alerts))
+metrics.INSTRUMENTS.set_function(lambda: sum(stats["instruments"] for stats in engine_stats.values()))
+metrics.DISPATCHER_BACKLOG.set_function(lambda: dispatcher.queue_depth)
+metrics.QUARANTINED_INSTRUMENTS.set_function(lambda: sum(stats["quarantined"] for stats in engine_stats.values()))
+# نفس الـ exchange قد يكون متوقفاً في أكثر من عملية فحص
+metrics.OPEN_CIRCUITS.set_function(lambda: max((stats["open_circuits"] for stats in engine_stats.values()), default=0))
+
+# آخر قيم عدادات الذاكرات التي أضيفت إلى CACHE_LOOKUPS: (cache, result) -> (الذاكرة، العدد)
+cache_lookups_seen = {}
+
+def collect_cache_metrics():
+    for name, cache in (("resolver", resolver.cache), ("membership", membership_cache)):
+        for result, total in (("hit", cache.hits), ("miss", cache.misses)):
+            seen_cache, seen = cache_lookups_seen.get((name, result), (cache, 0))
+            # ذاكرة جديدة (بعد init_services) تبدأ عدادها من الصفر
+            added = total - seen if seen_cache is cache else total
+            if added:
+                metrics.CACHE_LOOKUPS.inc(added, cache=name, result=result)
+            cache_lookups_seen[(name, result)] = (cache, total)
+
+metrics.add_collector(collect_cache_metrics)
 
 # مراحل المحادثة لإنشاء التنبيه
 SELECT_SCREEN, SELECT_EXCHANGE, ENTER_SYMBOL, SELECT_CANDIDATE, ENTER_TARGET = range(5)
@@ -79,23 +175,212 @@ SELECT_SCREEN, SELECT_EXCHANGE, ENTER_SYMBOL, SELECT_CANDIDATE, ENTER_TARGET = r
 # --------------------
 # ديكوريتر للتحقق من عضوية المستخدم في القناة
 # --------------------
+membership_cache = TTLCache(MEMBERSHIP_CACHE_SIZE, MEMBERSHIP_TTL)
+
+def remember_membership(user_id: int, status: str):
+    is_member = status in MEMBER_STATUSES
+    membership_cache.set(user_id, is_member, None if is_member else MEMBERSHIP_NEGATIVE_TTL)
+    return is_member
+
 def require_channel_membership(func):
     async def wrapper(update: Update, context: ContextTypes.DEFAULT_TYPE, *args, **kwargs):
         user_id = update.effective_user.id
-        try:
-            member = await context.bot.get_chat_member(CHANNEL_USERNAME, user_id)
-            if member.status not in ['creator', 'administrator', 'member']:
-                raise Exception
-        except Exception:
+        is_member = membership_cache.get(user_id)
+        if is_member is None:
+            try:
+                member = await context.bot.get_chat_member(CHANNEL_USERNAME, user_id)
+                is_member = remember_membership(user_id, member.status)
+            except Exception as e:
+                logger.warning(f"خطأ في التحقق من عضوية المستخدم {user_id} في {CHANNEL_USERNAME}: {e}")
+                is_member = MEMBERSHIP_FAIL_OPEN
+        if not is_member:
             await update.message.reply_text(f"⚠️ يجب عليك الانضمام للقناة التالية أولاً: {CHANNEL_USERNAME}")
             # إذا كانت داخل محادثة حوارية (ConversationHandler)، ننهى المحادثة
             return ConversationHandler.END
         return await func(update, context, *args, **kwargs)
     return wrapper
 
+async def track_channel_membership(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """
+    تحديث ذاكرة العضوية فور انضمام أو مغادرة مستخدم للقناة (يتطلب أن يكون البوت مشرفاً في القناة).
+    """
+    chat_member = update.chat_member
+    if (chat_member.chat.username or "").lower() != CHANNEL_USERNAME.lstrip("@").lower():
+        return
+    new_member = chat_member.new_chat_member
+    remember_membership(new_member.user.id, new_member.status)
+
+# --------------------
+# إضافة وحذف التنبيهات (مع الحفاظ على تزامن الفهرس)
+# --------------------
+def instrument_of(alert_obj):
+    return (alert_obj["symbol"], alert_obj["screener"], alert_obj["exchange"])
+
+def index_user_alert(alert_obj):
+    user_alerts.setdefault(alert_obj["user_id"], set()).add(alert_obj["alert_id"])
+
+def unindex_user_alert(alert_obj):
+    ids = user_alerts.get(alert_obj["user_id"])
+    if ids is not None:
+        ids.discard(alert_obj["alert_id"])
+        if not ids:
+            del user_alerts[alert_obj["user_id"]]
+
+def add_alert(alert_obj):
+    alerts.add(alert_obj)
+    index_user_alert(alert_obj)
+    engine.add_price_alert(instrument_of(alert_obj), alert_obj["target_price"], alert_obj["alert_id"])
+    storage.insert_alert(alert_obj)
+
+def remove_alert(alert_id):
+    alert_obj = alerts.pop(alert_id, None)
+    if alert_obj is not None:
+        engine.remove_price_alert(instrument_of(alert_obj), alert_obj["target_price"], alert_id)
+        unindex_user_alert(alert_obj)
+        storage.delete_alert(alert_id)
+    return alert_obj
+
+def add_condition_alert(alert_obj, condition):
+    condition_alerts[alert_obj["alert_id"]] = alert_obj
+    index_user_alert(alert_obj)
+    engine.add_condition_alert(alert_obj["alert_id"], instrument_of(alert_obj), condition)
+    storage.insert_condition_alert(alert_obj)
+
+def remove_condition_alert(alert_id):
+    alert_obj = condition_alerts.pop(alert_id, None)
+    if alert_obj is not None:
+        engine.remove_condition_alert(alert_id, instrument_of(alert_obj))
+        unindex_user_alert(alert_obj)
+        storage.delete_condition_alert(alert_id)
+    return alert_obj
+
+def engine_source():
+    """
+    كل التنبيهات الحالية بصيغة PriceEngine.load (لتحميل المحرك أو إعادة توزيع الأدوات على العمليات).
+    """
+    price_items = (
+        (instrument, target_price, alert_id)
+        for instrument, pairs in alerts.by_instrument().items()
+        for target_price, alert_id in pairs
+    )
+    condition_items = (
+        (alert_id, instrument_of(alert_obj), alert_obj["condition"])
+        for alert_id, alert_obj in condition_alerts.items()
+    )
+    return price_items, condition_items
+
+def load_state():
+    """
+    إعادة بناء التنبيهات والفهارس والدعوات من قاعدة البيانات عند بدء التشغيل.
+    """
+    global symbol_catalog
+    started = time.perf_counter()
+    # التحميل ينشئ مئات آلاف الكائنات التي تبقى طوال التشغيل، فلا فائدة من مرور جامع القمامة عليها أثناء بنائها،
+    # وبعده تُنقل إلى الجيل الدائم (gc.freeze) حتى لا تفحصها عمليات الجمع الكاملة لاحقاً
+    gc.disable()
+    try:
+        # كل دفعة تُحوّل إلى أعمدة مرة واحدة، ومنها تُبنى أعمدة المخزن وفهرس المستخدمين وتنبيهات المحرك في نفس المرور
+        price_items = []
+        for rows in storage.load_alerts():
+            alert_ids, screeners, exchanges, symbols, targets, chat_ids, user_ids = zip(*rows)
+            instruments = list(zip(symbols, screeners, exchanges))
+            alerts.extend(alert_ids, instruments, targets, chat_ids, user_ids)
+            price_items.extend(zip(instruments, targets, alert_ids))
+            for user_id, alert_id in zip(user_ids, alert_ids):
+                user_alerts.setdefault(user_id, set()).add(alert_id)
+        for alert_obj in storage.load_condition_alerts():
+            try:
+                compile_condition(alert_obj["condition"])
+            except ConditionError as e:
+                logger.error(f"تعذر تحميل شرط التنبيه رقم {alert_obj['alert_id']}: {e}")
+                continue
+            condition_alerts[alert_obj["alert_id"]] = alert_obj
+        for alert_obj in condition_alerts.values():
+            index_user_alert(alert_obj)
+        engine.load(price_items, (
+            (alert_id, instrument_of(alert_obj), alert_obj["condition"]) for alert_id, alert_obj in condition_alerts.items()
+        ))
+        for invited_user, referrer in storage.load_referrals():
+            invited_users[invited_user] = referrer
+            referrals.setdefault(referrer, set()).add(invited_user)
+        symbol_catalog = SymbolCatalog(storage.load_symbols())
+    finally:
+        gc.enable()
+    gc.freeze()
+    logger.info(f"تم تحميل {len(alerts)} تنبيه و{len(condition_alerts)} تنبيه شرطي و{len(invited_users)} دعوة و{len(symbol_catalog)} رمز من قاعدة البيانات خلال {time.perf_counter() - started:.3f} ثانية")
+
 # --------------------
 # دوال البحث عن رموز العملة
 # --------------------
+# الـ screeners والـ exchanges التي يتم البحث فيها وتحميل قائمة الرموز المحلية منها
+SEARCH_SCREENERS = [
+    "crypto",
+    "forex",
+    "cfd",
+    "indices",
+    "america"  # الأسهم الأمريكية
+]
+SEARCH_EXCHANGES = list(EXCHANGE_OPTIONS.values())
+
+async def refresh_symbol_catalog(context: ContextTypes.DEFAULT_TYPE):
+    """
+    تحديث قائمة الرموز المحلية في الخلفية (طلب listing واحد لكل screener).
+    إذا فشل أحد الـ screeners نحتفظ برموزه السابقة.
+    """
+    global symbol_catalog
+    outcomes = await asyncio.gather(
+        *(fetcher.fetch_listing(screener, SEARCH_EXCHANGES) for screener in SEARCH_SCREENERS),
+        return_exceptions=True
+    )
+    entries = []
+    refreshed = 0
+    for screener, rows in zip(SEARCH_SCREENERS, outcomes):
+        if isinstance(rows, BaseException) or not rows:
+            logger.error(f"خطأ في تحديث قائمة رموز {screener}: {rows!r}")
+            entries.extend(entry for entry in symbol_catalog.entries() if entry[1] == screener)
+            continue
+        refreshed += 1
+        entries.extend(rows)
+    if not refreshed:
+        return
+    loop = asyncio.get_running_loop()
+    catalog = await loop.run_in_executor(None, SymbolCatalog, entries)
+    await loop.run_in_executor(None, storage.replace_symbols, catalog.entries())
+    symbol_catalog = catalog
+    logger.info(f"تم تحديث قائمة الرموز المحلية: {len(catalog)} رمز")
+
+async def resolve_instruments(refs):
+    """
+    إيجاد الـ screener لعدة رموز دفعة واحدة، كل رمز كـ (symbol, exchange) (مثلاً BTCUSDT@BINANCE):
+    من القائمة المحلية أولاً، ثم الرموز المجهولة كلها في طلب مجمّع واحد لكل screener.
+    يعيد قاموساً (SYMBOL, EXCHANGE) -> (symbol, screener, exchange) أو None.
+    """
+    results = {}
+    unknown = []
+    for symbol, exchange in refs:
+        key = (symbol.strip().upper(), exchange.strip().upper())
+        if key in results:
+            continue
+        results[key] = None
+        for entry in symbol_catalog.search(key[0], MAX_SEARCH_RESULTS, exchange=key[1]):
+            if entry[0] == key[0] and entry[2] == key[1]:
+                results[key] = entry
+                break
+        else:
+            unknown.append(key)
+    if unknown:
+        candidates = [(symbol, screener, exchange) for symbol, exchange in unknown for screener in SEARCH_SCREENERS]
+        found = await resolver.resolve(candidates)
+        for instrument in candidates:
+            key = (instrument[0], instrument[2])
+            if results[key] is None and found.get(instrument):
+                results[key] = instrument
+    return results
+
+async def resolve_instrument(symbol: str, exchange: str):
+    results = await resolve_instruments([(symbol, exchange)])
+    return results[(symbol.strip().upper(), exchange.strip().upper())]
+
 def generate_candidate_symbols(symbol: str):
     """
     توليد مجموعة من المرشحات لرمز العملة المُدخل.
@@ -108,54 +393,44 @@ def generate_candidate_symbols(symbol: str):
     candidates.add(normalized.lower())
     return list(candidates)
 
-def search_symbol_across_all(symbol: str):
+async def search_symbol_across_all(symbol: str):
     """
     البحث عن رمز العملة في عدة screeners وexchanges باستخدام المرشحات.
+    يتم إرسال طلب scanner مجمّع واحد لكل screener وتنفيذ الطلبات بالتوازي،
+    مع التوقف بمجرد العثور على MAX_SEARCH_RESULTS نتيجة.
     يعيد قائمة من التركيبات كـ (candidate, screener, exchange).
     """
     candidates = generate_candidate_symbols(symbol)
-    
-    screeners = [
-        "crypto",
-        "forex",
-        "cfd",
-        "indices",
-        "america"  # الأسهم الأمريكية
-    ]
-    
-    exchanges = [
-        "OANDA",
-        "BINANCE",
-        "FX",
-        "PEPPERSTONE",
-        "FOREXCOM",
-        "TVC",
-        "CAPITALCOM",
-        "BITFINEX",
-        "KRAKEN",
-        "COINBASE",
-        "BITSTAMP"
-        "CRYPTOCAP",
-        "MEXC",
-    ]
-    
-    results = []  # لتخزين التركيبات الناجحة
-    for screener in screeners:
+    screeners = SEARCH_SCREENERS
+    exchanges = SEARCH_EXCHANGES
+
+    async def search_screener(screener):
+        # كل التركيبات (exchange, candidate) لهذا الـ screener في طلب واحد
+        instruments = {}
+        for exchange in exchanges:
+            for candidate in candidates:
+                instrument = (candidate, screener, exchange)
+                instruments.setdefault(ticker_of(instrument), instrument)
+        found = await resolver.resolve(list(instruments.values()))
+        matches = []
         for exchange in exchanges:
             for candidate in candidates:
-                try:
-                    handler = TA_Handler(
-                        symbol=candidate,
-                        screener=screener,
-                        exchange=exchange,
-                        interval=Interval.INTERVAL_5_MINUTES
-                    )
-                    handler.get_analysis()
-                    results.append((candidate, screener, exchange))
+                if found.get(instruments[ticker_of((candidate, screener, exchange))]):
+                    matches.append((candidate, screener, exchange))
                     break
-                except Exception:
-                    continue
-    return results
+        return matches
+
+    results = []  # لتخزين التركيبات الناجحة
+    tasks = [asyncio.ensure_future(search_screener(screener)) for screener in screeners]
+    try:
+        for task in asyncio.as_completed(tasks):
+            results.extend(await task)
+            if len(results) >= MAX_SEARCH_RESULTS:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+    return results[:MAX_SEARCH_RESULTS]
 
 # --------------------
 # أوامر البوت
@@ -182,6 +457,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
             if referrer_id not in referrals:
                 referrals[referrer_id] = set()
             referrals[referrer_id].add(user_id)
+            storage.add_referral(user_id, referrer_id)
             invite_count = len(referrals[referrer_id])
             remaining = REQUIRED_INVITES - invite_count
             if remaining > 0:
@@ -230,20 +506,31 @@ async def info(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "   - هذا الخيار يعني 'البروكر' الذي يتم التحليل عليه.\n"
         "   - مثال: إذا كنت تريد تنبيهًا على eurusd، فتأكد من اختيار منصة تداول تدعم الفوركس مثل forexcom أو oanda، حسب الخيارات المتاحة.\n\n"
         "3. إذا أخطأت في خطوة ما:\n"
-        "   - لا تقلق! إذا أدخلت رمزًا غير صحيح أو اخترت خيارًا خاطئًا، سيبحث البوت عن الأماكن الممكنة لوضع تنبيهك، وسيعرض عليك قائمة منها لتختار الخيار المناسب."
+        "   - لا تقلق! إذا أدخلت رمزًا غير صحيح أو اخترت خيارًا خاطئًا، سيبحث البوت عن الأماكن الممكنة لوضع تنبيهك، وسيعرض عليك قائمة منها لتختار الخيار المناسب.\n\n"
+        "لتنبيهات المؤشرات استخدم أمر /when، مثلاً:\n"
+        "/when BTCUSDT@BINANCE RSI@4h < 30\n\n"
+        "لإنشاء عدة تنبيهات برسالة واحدة استخدم /alerts_add (سطر لكل تنبيه بالشكل BTCUSDT@BINANCE 65000)، "
+        "ولعرض تنبيهاتك استخدم /alerts."
     )
     await update.message.reply_text(info_text)
 
 # ----------------------------------
 # محادثة /alert لجمع بيانات التنبيه
 # ----------------------------------
-@require_channel_membership
-async def alert_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def check_invites(update: Update) -> bool:
+    """
+    التحقق من شرط الدعوات إذا كان مفروضاً (مع إبلاغ المستخدم إذا لم يتحقق).
+    """
     user_id = update.effective_user.id
-    # التحقق من شرط الدعوات إذا كان مفروضاً
     if not (user_id in referrals and len(referrals[user_id]) >= REQUIRED_INVITES) and REQUIRED_INVITES != 0:
         invite_text = f"{REQUIRED_INVITES} شخص" if REQUIRED_INVITES == 1 else f"{REQUIRED_INVITES} أشخاص"
         await update.message.reply_text(f"⚠️ لا يمكنك استخدام التنبيهات حتى تقوم بدعوة {invite_text} على الأقل.")
+        return False
+    return True
+
+@require_channel_membership
+async def alert_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if not await check_invites(update):
         return ConversationHandler.END
 
     options_text = "لإنشاء تنبيه جديد، اختر نوع الـ screener بإدخال الرقم المناسب:\n"
@@ -280,20 +567,21 @@ async def enter_symbol(update: Update, context: ContextTypes.DEFAULT_TYPE):
         return ENTER_SYMBOL
     screener = context.user_data["screener"]
     exchange = context.user_data["exchange"]
-    try:
-        handler = TA_Handler(
-            symbol=symbol.upper(),
-            screener=screener,
-            exchange=exchange,
-            interval=Interval.INTERVAL_5_MINUTES
-        )
-        handler.get_analysis()
+    instrument = (symbol.upper(), screener, exchange)
+    # القائمة المحلية أولاً (بدون أي طلب شبكة)، ثم التحقق عبر TradingView إذا لم تعرف القائمة الرمز
+    # (القائمة قد تكون قديمة أو ناقصة)، وفقط بعد ذلك نقترح الرموز المشابهة من القائمة
+    results = []
+    valid = instrument in symbol_catalog or await resolver.exists(instrument)
+    if not valid:
+        results = symbol_catalog.search(symbol, MAX_SEARCH_RESULTS, screener, exchange)
+    if valid:
         context.user_data["symbol"] = symbol.upper()
         await update.message.reply_text("تم التحقق من رمز العملة بنجاح.\nأدخل السعر الهدف للتنبيه:")
         return ENTER_TARGET
-    except Exception as e:
-        logger.error(f"فشل التحقق من رمز {symbol} باستخدام الخيارات [{screener}, {exchange}]: {e}")
-        results = search_symbol_across_all(symbol)
+    else:
+        if not results:
+            logger.error(f"فشل التحقق من رمز {symbol} باستخدام الخيارات [{screener}, {exchange}]")
+            results = await search_symbol_across_all(symbol)
         if not results:
             await update.message.reply_text(f"⚠️ حدث خطأ في جلب بيانات {symbol} باستخدام الخيارات [{screener}, {exchange}].\nلم يتم العثور على هذه العملة.")
             return ConversationHandler.END
@@ -327,17 +615,28 @@ async def select_candidate(update: Update, context: ContextTypes.DEFAULT_TYPE):
     )
     return ENTER_TARGET
 
-async def enter_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
+def parse_target_price(text: str):
+    """
+    السعر الهدف من نص المستخدم (مع قبول فاصل الآلاف)، أو None إذا لم يكن رقماً محدوداً أكبر من صفر
+    (NaN لا يقبل المقارنة فيفسد ترتيب فهرس الأهداف). نفس القاعدة لـ /alert و /alerts_add.
+    """
     try:
-        target_price = float(update.message.text.strip())
+        target_price = float(text.strip().replace(",", ""))
     except ValueError:
-        await update.message.reply_text("❌ يرجى إدخال قيمة رقمية للسعر الهدف.")
+        return None
+    if not math.isfinite(target_price) or target_price <= 0:
+        return None
+    return target_price
+
+async def enter_target(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    target_price = parse_target_price(update.message.text)
+    if target_price is None:
+        await update.message.reply_text("❌ يرجى إدخال قيمة رقمية أكبر من صفر للسعر الهدف.")
         return ENTER_TARGET
     context.user_data["target_price"] = target_price
     return await confirm_alert(update, context)
 
 async def confirm_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    global alert_counter
     screener = context.user_data["screener"]
     exchange = context.user_data["exchange"]
     symbol = context.user_data["symbol"]
@@ -345,8 +644,7 @@ async def confirm_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = update.effective_chat.id
     user_id = update.effective_user.id
 
-    alert_id = alert_counter
-    alert_counter += 1
+    alert_id = storage.next_alert_id()
 
     confirm_text = (
         f"تم إنشاء تنبيه رقم {alert_id} للعملة {symbol} عند السعر {target_price}.\n"
@@ -366,7 +664,7 @@ async def confirm_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "chat_id": chat_id,
         "user_id": user_id
     }
-    alerts[alert_id] = alert_obj
+    add_alert(alert_obj)
     logger.info(f"تم إضافة تنبيه جديد (رقم {alert_id}) للدردشة {chat_id}: {symbol} عند {target_price}")
     return ConversationHandler.END
 
@@ -374,6 +672,171 @@ async def alert_cancel_conversation(update: Update, context: ContextTypes.DEFAUL
     await update.message.reply_text("❌ تم إلغاء إنشاء التنبيه.")
     return ConversationHandler.END
 
+# ---------------------------------------------
+# تنفيذ أمر /when لإنشاء تنبيه على شرط مؤشرات
+# ---------------------------------------------
+WHEN_USAGE = (
+    "الصيغة: /when SYMBOL@EXCHANGE الشرط\n"
+    "أمثلة:\n"
+    "/when BTCUSDT@BINANCE RSI < 30\n"
+    "/when EURUSD@OANDA close crosses_above EMA50@4h\n"
+    "/when ETHUSDT@BINANCE change@1h > 2 and RSI@15m > 70\n"
+    "الفترات المتاحة بعد @: 1m 5m 15m 30m 1h 2h 4h 1d 1w 1M (الافتراضي 1h)."
+)
+
+@require_channel_membership
+async def when_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    args = context.args
+    if len(args) < 2 or "@" not in args[0]:
+        await update.message.reply_text(f"❌ يرجى تحديد الرمز والشرط.\n{WHEN_USAGE}")
+        return
+    user_id = update.effective_user.id
+    if not await check_invites(update):
+        return
+    try:
+        condition = compile_condition(" ".join(args[1:]))
+    except ConditionError as e:
+        await update.message.reply_text(f"❌ {e}\n{WHEN_USAGE}")
+        return
+    symbol, _, exchange = args[0].partition("@")
+    instrument = await resolve_instrument(symbol, exchange)
+    if instrument is None:
+        await update.message.reply_text(f"❌ لم يتم العثور على {symbol.upper()} في {exchange.upper()}.")
+        return
+
+    symbol, screener, exchange = instrument
+    alert_id = storage.next_alert_id()
+    chat_id = update.effective_chat.id
+    alert_obj = {
+        "alert_id": alert_id,
+        "screener": screener,
+        "exchange": exchange,
+        "symbol": symbol,
+        "condition": condition.text,
+        "chat_id": chat_id,
+        "user_id": user_id
+    }
+    add_condition_alert(alert_obj, condition)
+    await update.message.reply_text(
+        f"تم إنشاء تنبيه رقم {alert_id} للعملة {symbol} عند تحقق الشرط: {condition.text}\n"
+        f"التفاصيل:\n"
+        f"• Screener: {screener}\n"
+        f"• Exchange: {exchange}"
+    )
+    logger.info(f"تم إضافة تنبيه شرطي جديد (رقم {alert_id}) للدردشة {chat_id}: {symbol} عند {condition.text}")
+
+# ---------------------------------------------
+# أوامر /alerts_add لإنشاء عدة تنبيهات و /alerts لعرض التنبيهات
+# ---------------------------------------------
+ALERTS_ADD_USAGE = (
+    "الصيغة: /alerts_add ثم سطر لكل تنبيه بالشكل SYMBOL@EXCHANGE السعر\n"
+    "مثال:\n"
+    "/alerts_add\n"
+    "BTCUSDT@BINANCE 65000\n"
+    "EURUSD@OANDA 1.1"
+)
+
+def parse_bulk_lines(text: str):
+    """
+    تحليل أسطر /alerts_add؛ يعيد (تنبيهات صالحة كـ (رقم السطر, symbol, exchange, target), أخطاء كـ (رقم السطر, النص)).
+    """
+    entries, errors = [], []
+    lines = [line.strip() for line in text.splitlines()]
+    for number, line in enumerate(lines, start=1):
+        if not line:
+            continue
+        parts = line.split()
+        if len(parts) != 2 or "@" not in parts[0]:
+            errors.append((number, f"السطر {number}: صيغة غير صحيحة ({line})"))
+            continue
+        symbol, _, exchange = parts[0].partition("@")
+        target_price = parse_target_price(parts[1])
+        if target_price is None:
+            errors.append((number, f"السطر {number}: السعر غير صالح ({parts[1]})"))
+            continue
+        if not symbol or not exchange:
+            errors.append((number, f"السطر {number}: صيغة غير صحيحة ({line})"))
+            continue
+        entries.append((number, symbol.upper(), exchange.upper(), target_price))
+    return entries, errors
+
+@require_channel_membership
+async def alerts_add(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    # النص بعد الأمر نفسه (قد يبدأ في نفس السطر أو في الأسطر التالية)
+    text = update.message.text.split(None, 1)[1] if len(update.message.text.split(None, 1)) > 1 else ""
+    entries, errors = parse_bulk_lines(text)
+    if not entries and not errors:
+        await update.message.reply_text(f"❌ يرجى إدخال تنبيه واحد على الأقل.\n{ALERTS_ADD_USAGE}")
+        return
+    if len(entries) > MAX_BULK_ALERTS:
+        await update.message.reply_text(f"❌ الحد الأقصى {MAX_BULK_ALERTS} تنبيه في الرسالة الواحدة.")
+        return
+    if not await check_invites(update):
+        return
+
+    # التحقق من كل الرموز معاً (القائمة المحلية ثم طلب مجمّع واحد لكل screener للرموز المجهولة)
+    resolved = await resolve_instruments([(symbol, exchange) for _, symbol, exchange, _ in entries])
+    user_id = update.effective_user.id
+    chat_id = update.effective_chat.id
+    created = []
+    for number, symbol, exchange, target_price in entries:
+        instrument = resolved.get((symbol, exchange))
+        if instrument is None:
+            errors.append((number, f"السطر {number}: لم يتم العثور على {symbol} في {exchange}"))
+            continue
+        alert_id = storage.next_alert_id()
+        add_alert({
+            "alert_id": alert_id,
+            "screener": instrument[1],
+            "exchange": instrument[2],
+            "symbol": instrument[0],
+            "target_price": target_price,
+            "chat_id": chat_id,
+            "user_id": user_id
+        })
+        created.append(f"• رقم {alert_id}: {instrument[0]} ({instrument[2]}) عند {target_price}")
+    logger.info(f"تم إضافة {len(created)} تنبيه دفعة واحدة للدردشة {chat_id}")
+
+    lines = []
+    if created:
+        lines.append(f"✅ تم إنشاء {len(created)} تنبيه:")
+        lines.extend(created)
+    if errors:
+        lines.append(f"⚠️ لم يتم إنشاء {len(errors)} تنبيه:")
+        lines.extend(text for _, text in sorted(errors))
+    await reply_lines(update, lines)
+
+async def reply_lines(update: Update, lines):
+    """
+    إرسال أسطر طويلة على عدة رسائل بحيث لا تتجاوز أي رسالة حد Telegram.
+    """
+    chunk = ""
+    for line in lines:
+        if chunk and len(chunk) + len(line) + 1 > MAX_MESSAGE_LENGTH:
+            await update.message.reply_text(chunk)
+            chunk = ""
+        chunk = f"{chunk}\n{line}" if chunk else line
+    if chunk:
+        await update.message.reply_text(chunk)
+
+@require_channel_membership
+async def list_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    alert_ids = sorted(user_alerts.get(update.effective_user.id, ()))
+    if not alert_ids:
+        await update.message.reply_text("لا توجد لديك تنبيهات حالياً. استخدم /alert أو /alerts_add لإنشاء تنبيه.")
+        return
+    lines = [f"📋 تنبيهاتك ({len(alert_ids)}):"]
+    for alert_id in alert_ids:
+        alert_obj = alerts.get(alert_id)
+        if alert_obj:
+            lines.append(f"• رقم {alert_id}: {alert_obj['symbol']} ({alert_obj['exchange']}) عند {alert_obj['target_price']}")
+            continue
+        alert_obj = condition_alerts.get(alert_id)
+        if alert_obj:
+            lines.append(f"• رقم {alert_id}: {alert_obj['symbol']} ({alert_obj['exchange']}) عند {alert_obj['condition']}")
+    lines.append("لإلغاء تنبيه: /cancel رقم_التنبيه")
+    await reply_lines(update, lines)
+
 # ---------------------------------------------
 # تنفيذ أمر /cancel لإلغاء تنبيه موجود برقم معين
 # ---------------------------------------------
@@ -389,50 +852,96 @@ async def cancel_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("❌ رقم التنبيه غير صالح.")
         return
     alert_obj = alerts.get(alert_id)
+    if not alert_obj:
+        alert_obj = condition_alerts.get(alert_id)
     if not alert_obj:
         await update.message.reply_text("❌ لا يوجد تنبيه بهذا الرقم.")
         return
     if update.effective_user.id != alert_obj["user_id"]:
         await update.message.reply_text("❌ ليس لديك الصلاحية لإلغاء هذا التنبيه.")
         return
-    del alerts[alert_id]
+    if alert_id in alerts:
+        remove_alert(alert_id)
+    else:
+        remove_condition_alert(alert_id)
     await update.message.reply_text(f"✅ تم إلغاء التنبيه رقم {alert_id}.")
     logger.info(f"تنبيه رقم {alert_id} تم إلغاؤه من قبل المستخدم {update.effective_user.id}.")
 
 # -----------------------------
 # مهمة فحص الأسعار بشكل دوري
 # -----------------------------
+def quarantine_instrument(instrument, alert_ids):
+    """
+    إبلاغ أصحاب تنبيهات أداة تم عزلها (تُجرّب فقط على فترات متباعدة) مرة واحدة.
+    """
+    symbol, screener, exchange = instrument
+    for alert_id in alert_ids:
+        alert_obj = alerts.get(alert_id) or condition_alerts.get(alert_id)
+        if not alert_obj:
+            continue
+        dispatcher.enqueue(
+            alert_obj["chat_id"],
+            f"⚠️ تنبيه رقم {alert_id}: تعذر جلب بيانات {symbol} ({exchange}) لفترة طويلة، لذلك تم إيقاف مراقبته مؤقتاً.\n"
+            f"يمكنك إلغاؤه عبر /cancel {alert_id}"
+        )
+
+def notify_triggered(alert_id):
+    """
+    تنبيه فعّله المحرك (وحذفه من فهارسه): حذفه من الذاكرة والقاعدة وإرسال الإشعار.
+    """
+    alert_obj = alerts.pop(alert_id, None)
+    if alert_obj is not None:
+        unindex_user_alert(alert_obj)
+        storage.delete_alert(alert_id)
+        text = f"⚠️ تنبيه رقم {alert_id}: تم تفعيل التنبيه للعملة {alert_obj['symbol']} عند السعر {alert_obj['target_price']}."
+        detail = f"عند {alert_obj['target_price']}"
+    else:
+        alert_obj = condition_alerts.pop(alert_id, None)
+        if alert_obj is None:
+            # أُلغي التنبيه قبل وصول الحدث
+            return
+        unindex_user_alert(alert_obj)
+        storage.delete_condition_alert(alert_id)
+        text = f"⚠️ تنبيه رقم {alert_id}: تحقق الشرط {alert_obj['condition']} للعملة {alert_obj['symbol']} ({alert_obj['exchange']})."
+        detail = f"بالشرط {alert_obj['condition']}"
+    metrics.TRIGGERED_ALERTS.inc()
+    dispatcher.enqueue(alert_obj["chat_id"], text)
+    logger.info(f"تم تفعيل التنبيه رقم {alert_id} لـ {alert_obj['symbol']} {detail} في الدردشة {alert_obj['chat_id']}")
+
+def record_cycle(stats):
+    engine_stats[stats["worker"]] = stats
+    for screener, exchange in stats["fetch_errors"]:
+        metrics.FETCH_ERRORS.inc(screener=screener, exchange=exchange)
+    if stats["due"]:
+        metrics.CHECK_CYCLE_DURATION.observe(stats["duration"])
+        metrics.CHECK_CYCLE_INSTRUMENTS.set(stats["due"])
+    # الدورات التي لا شيء مستحق فيها لا تُحسب ناجحة إذا فشل آخر طلب (الأدوات مؤجلة بعد الفشل فقط)
+    if stats["upstream_ok"] and (stats["fetched"] or not stats["due"]):
+        metrics.LAST_SUCCESSFUL_CYCLE.set(time.time())
+
+async def resize_workers(delta):
+    """
+    تغيير عدد عمليات فحص الأسعار أثناء التشغيل (SIGUSR1 لإضافة عملية، SIGUSR2 لإزالة عملية).
+    تنتقل فقط الأدوات التي تغير مالكها، وتُحذف ملخصات العمليات المزالة من المقاييس.
+    """
+    size = max(1, engine.size + delta)
+    if size == engine.size:
+        return
+    await engine.resize(size)
+    for worker_id in list(engine_stats):
+        if worker_id >= size:
+            del engine_stats[worker_id]
+
 async def check_prices(context: ContextTypes.DEFAULT_TYPE):
-    for alert_id, alert_obj in list(alerts.items()):
-        symbol = alert_obj["symbol"]
-        screener = alert_obj["screener"]
-        exchange = alert_obj["exchange"]
-        target_price = alert_obj["target_price"]
-        chat_id = alert_obj["chat_id"]
-        try:
-            handler = TA_Handler(
-                symbol=symbol,
-                screener=screener,
-                exchange=exchange,
-                interval=Interval.INTERVAL_5_MINUTES
-            )
-            analysis = handler.get_analysis()
-            indicators = analysis.indicators
-            high_price = float(indicators.get('high', 0))
-            low_price = float(indicators.get('low', 0))
-            # حذف التنبيه عند تفعيل السعر
-            if low_price <= target_price <= high_price:
-                context.application.create_task(
-                    context.application.bot.send_message(
-                        chat_id=chat_id,
-                        text=f"⚠️ تنبيه رقم {alert_id}: تم تفعيل التنبيه للعملة {symbol} عند السعر {target_price}."
-                    )
-                )
-                del alerts[alert_id]
-                logger.info(f"تم تفعيل التنبيه رقم {alert_id} لـ {symbol} عند {target_price} في الدردشة {chat_id}")
-        except Exception as e:
-            logger.error(f"خطأ في جلب بيانات {symbol} ({screener}, {exchange}): {e}")
-            # لن يتم إرسال إشعار للمستخدم، والتنبيه سيبقى محفوظاً لإعادة المحاولة لاحقاً.
+    # دورة فحص داخل هذه العملية، أو قراءة ما أرسلته عمليات الفحص منذ آخر مرة
+    for event in await engine.poll():
+        kind = event[0]
+        if kind in ("price", "condition"):
+            notify_triggered(event[1])
+        elif kind == "quarantined":
+            quarantine_instrument(event[1], event[2])
+        elif kind == "cycle":
+            record_cycle(event[1])
 
 # -----------------------------
 # إعداد قائمة الأوامر (عند كتابة /)
@@ -442,17 +951,92 @@ async def set_commands(application):
         BotCommand("start", "بدء البوت والتحقق من الشروط"),
         BotCommand("info", "تعليمات استخدام البوت"),
         BotCommand("alert", "إنشاء تنبيه جديد"),
+        BotCommand("when", "تنبيه عند تحقق شرط مؤشرات (مثلاً RSI < 30)"),
+        BotCommand("alerts_add", "إنشاء عدة تنبيهات برسالة واحدة"),
+        BotCommand("alerts", "عرض تنبيهاتك"),
         BotCommand("cancel", "إلغاء تنبيه برقم التنبيه")
     ]
     await application.bot.set_my_commands(commands)
     logger.info("تم إعداد أوامر البوت.")
 
+async def run_price_checks(first=10):
+    """
+    فحص الأسعار كمهمة واحدة طويلة العمر بدلاً من مهمة مكررة في job_queue: الدورة قد تطول حتى FETCH_TIMEOUT،
+    وكل دورة تبدأ بعد SCHEDULER_TICK من انتهاء السابقة، فلا تتداخل الدورات ولا تتخطاها APScheduler بتحذير كل مرة.
+    """
+    await asyncio.sleep(first)
+    while True:
+        try:
+            await check_prices(None)
+        except Exception as e:
+            logger.error(f"خطأ في دورة فحص الأسعار: {e!r}")
+        await asyncio.sleep(SCHEDULER_TICK)
+
+async def post_init(application):
+    global price_checks
+    dispatcher.start(application.bot)
+    price_checks = asyncio.create_task(run_price_checks())
+
+async def post_shutdown(application):
+    if price_checks is not None:
+        price_checks.cancel()
+        try:
+            await price_checks
+        except asyncio.CancelledError:
+            pass
+    await dispatcher.stop()
+    await engine.stop()
+
 # -----------------------------
 # التشغيل الرئيسي للبوت
 # -----------------------------
+async def run_webhook(app):
+    """
+    تشغيل البوت في وضع الـ webhook: نفس خادم HTTP يستقبل التحديثات ويخدم /metrics و /healthz
+    على نفس حلقة الأحداث، حتى وصول إشارة إيقاف.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    await app.initialize()
+    await post_init(app)
+    server = keep_alive(app, WEBHOOK_PATH, WEBHOOK_SECRET)
+    try:
+        await app.bot.set_webhook(
+            url=f"{WEBHOOK_URL}/{WEBHOOK_PATH.strip('/')}",
+            allowed_updates=Update.ALL_TYPES,
+            secret_token=WEBHOOK_SECRET,
+            max_connections=WEBHOOK_MAX_CONNECTIONS
+        )
+        await app.start()
+        logger.info(f"البوت يعمل في وضع الـ webhook على {WEBHOOK_URL}")
+        await stop_event.wait()
+    finally:
+        server.stop()
+        if app.running:
+            await app.stop()
+        await post_shutdown(app)
+        await app.shutdown()
+
 async def main():
-    keep_alive()
-    app = ApplicationBuilder().token(TOKEN).build()
+    init_services()
+    storage.open()
+    await engine.start()
+    load_state()
+    if isinstance(engine, WorkerPool) and hasattr(signal, "SIGUSR1"):
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGUSR1, lambda: asyncio.ensure_future(resize_workers(1)))
+        loop.add_signal_handler(signal.SIGUSR2, lambda: asyncio.ensure_future(resize_workers(-1)))
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+        .post_init(post_init)
+        .post_shutdown(post_shutdown)
+        .build()
+    )
 
     await set_commands(app)
 
@@ -472,11 +1056,39 @@ async def main():
     app.add_handler(CommandHandler("info", info))
     app.add_handler(alert_conv_handler)
     app.add_handler(CommandHandler("cancel", cancel_alert))
+    app.add_handler(CommandHandler("when", when_alert))
+    app.add_handler(CommandHandler("alerts_add", alerts_add))
+    app.add_handler(CommandHandler("alerts", list_alerts))
+    app.add_handler(ChatMemberHandler(track_channel_membership, ChatMemberHandler.CHAT_MEMBER))
 
-    app.job_queue.run_repeating(check_prices, interval=CHECK_INTERVAL, first=10)
+    app.job_queue.run_repeating(
+        refresh_symbol_catalog,
+        interval=CATALOG_REFRESH_INTERVAL,
+        first=5 if not len(symbol_catalog) else CATALOG_REFRESH_INTERVAL
+    )
 
-    logger.info("البوت يعمل...")
-    await app.run_polling(close_loop=False)
+    try:
+        if WEBHOOK_URL:
+            await run_webhook(app)
+        else:
+            # في وضع polling يبقى الخادم لمسارات الصحة والمقاييس فقط
+            keep_alive()
+            logger.info("البوت يعمل...")
+            # chat_member لا يُرسل افتراضياً، لذلك نطلب كل أنواع التحديثات
+            await app.run_polling(close_loop=False, allowed_updates=Update.ALL_TYPES)
+    finally:
+        storage.close()
 
 if __name__ == "__main__":
+    # إعداد logging للتصحيح
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO
+    )
+    # محاولة استيراد nest_asyncio لتجنب مشكلة "This event loop is already running"
+    try:
+        import nest_asyncio
+        nest_asyncio.apply()
+    except ImportError:
+        print("WARNING: يُفضل تثبيت مكتبة nest_asyncio عبر 'pip install nest_asyncio' لتجنب مشاكل حلقة الأحداث.")
     asyncio.run(main())
@@ -0,0 +1,191 @@
+import math
+from array import array
+from bisect import bisect_left, bisect_right
+
+
+class InstrumentAlerts:
+    """
+    تنبيهات أداة واحدة: الأسعار المستهدفة مرتبة تصاعدياً (float64)، وأرقام التنبيهات في مصفوفة موازية (int64)،
+    ورقم الملاحظة التي أضيف قبلها كل تنبيه (int64)، وآخر إغلاق وأعلى وأدنى سعر تمت رؤيتها لهذه الأداة.
+    """
+    __slots__ = ("targets", "alert_ids", "since", "observations", "last_close", "last_high", "last_low")
+
+    def __init__(self):
+        self.targets = array("d")
+        self.alert_ids = array("q")
+        self.since = array("q")
+        self.observations = 0
+        self.last_close = None
+        self.last_high = None
+        self.last_low = None
+
+
+class PriceIndex:
+    """
+    فهرس التنبيهات حسب الأداة (symbol, screener, exchange).
+    إيجاد التنبيهات التي يقع سعرها المستهدف داخل نطاق [low, high] يتم بالبحث الثنائي في O(log n + k).
+    """
+
+    def __init__(self):
+        self._by_instrument = {}
+        self._size = 0
+
+    def add(self, instrument, target_price: float, alert_id: int):
+        # NaN لا يقبل المقارنة فيفسد ترتيب البحث الثنائي لكل أهداف الأداة
+        assert math.isfinite(target_price), f"سعر مستهدف غير صالح: {target_price}"
+        entry = self._by_instrument.get(instrument)
+        if entry is None:
+            entry = self._by_instrument[instrument] = InstrumentAlerts()
+        i = bisect_right(entry.targets, target_price)
+        entry.targets.insert(i, target_price)
+        entry.alert_ids.insert(i, alert_id)
+        entry.since.insert(i, entry.observations)
+        self._size += 1
+
+    def bulk_load(self, items):
+        """
+        بناء الفهرس دفعة واحدة من (instrument, target_price, alert_id) بترتيب واحد لكل أداة
+        بدلاً من الإدراج واحداً تلو الآخر (يُستخدم عند بدء التشغيل).
+        """
+        grouped = {}
+        for instrument, target_price, alert_id in items:
+            grouped.setdefault(instrument, []).append((target_price, alert_id))
+        for instrument, pairs in grouped.items():
+            entry = self._by_instrument.get(instrument)
+            if entry is None:
+                # أداة جديدة (الحالة المعتادة عند بدء التشغيل): ترتيب الأزواج مباشرة دون دمج
+                entry = self._by_instrument[instrument] = InstrumentAlerts()
+                pairs.sort()
+                targets, alert_ids = zip(*pairs)
+                entry.targets = array("d", targets)
+                entry.alert_ids = array("q", alert_ids)
+                entry.since = array("q", [entry.observations]) * len(pairs)
+                self._size += len(pairs)
+                continue
+            rows = [(target_price, alert_id, entry.observations) for target_price, alert_id in pairs]
+            rows.extend(zip(entry.targets, entry.alert_ids, entry.since))
+            rows.sort(key=lambda row: row[0])
+            self._size += len(rows) - len(entry.targets)
+            entry.targets = array("d", [row[0] for row in rows])
+            entry.alert_ids = array("q", [row[1] for row in rows])
+            entry.since = array("q", [row[2] for row in rows])
+
+    def remove(self, instrument, target_price: float, alert_id: int) -> bool:
+        entry = self._by_instrument.get(instrument)
+        if entry is None:
+            return False
+        lo = bisect_left(entry.targets, target_price)
+        hi = bisect_right(entry.targets, target_price)
+        for i in range(lo, hi):
+            if entry.alert_ids[i] == alert_id:
+                del entry.targets[i]
+                del entry.alert_ids[i]
+                del entry.since[i]
+                self._size -= 1
+                if not entry.targets:
+                    del self._by_instrument[instrument]
+                return True
+        return False
+
+    def triggered(self, instrument, low: float, high: float):
+        """
+        أرقام التنبيهات التي يقع سعرها المستهدف بين low وhigh (شاملة الطرفين).
+        """
+        entry = self._by_instrument.get(instrument)
+        if entry is None or low > high:
+            return ()
+        lo = bisect_left(entry.targets, low)
+        hi = bisect_right(entry.targets, high)
+        return entry.alert_ids[lo:hi]
+
+    def _crossed_rows(self, entry, close, high, low):
+        """
+        صفوف التنبيهات التي عبر السعر هدفها منذ إضافتها، وتسجيل هذه الملاحظة كآخر ملاحظة للأداة:
+        - التنبيهات الموجودة عند الملاحظة السابقة: الشمعة الحالية [low, high] ممتدة إلى آخر إغلاق تمت رؤيته،
+          فلا يضيع هدف قفز السعر فوقه بين فحصين أو عند بداية شمعة جديدة.
+        - التنبيهات المضافة بعد الملاحظة السابقة: الشمعة الحالية فقط، لأن آخر إغلاق أقدم من التنبيه نفسه.
+        لا يكتشف هذا ارتداداً حدث داخل الشمعة السابقة بعد آخر ملاحظة، فالفجوة الأطول من شمعة قد تفوّت أهدافاً.
+        """
+        seen = entry.observations
+        if close and close > 0:
+            low, high = min(low or close, close), max(high, close)
+            entry.observations += 1
+            wide_low, wide_high = low, high
+            if entry.last_close is not None:
+                wide_low, wide_high = min(low, entry.last_close), max(high, entry.last_close)
+            entry.last_close, entry.last_high, entry.last_low = close, high, low
+        else:
+            wide_low, wide_high = low, high
+        if wide_low > wide_high:
+            return []
+        lo = bisect_left(entry.targets, wide_low)
+        hi = bisect_right(entry.targets, wide_high)
+        return [
+            i for i in range(lo, hi)
+            if entry.since[i] < seen or low <= entry.targets[i] <= high
+        ]
+
+    def crossed(self, instrument, close: float, high: float, low: float):
+        """
+        أرقام التنبيهات التي عبر السعر هدفها منذ إضافتها (انظر _crossed_rows).
+        """
+        entry = self._by_instrument.get(instrument)
+        if entry is None:
+            return ()
+        return array("q", [entry.alert_ids[i] for i in self._crossed_rows(entry, close, high, low)])
+
+    def pop_crossed(self, instrument, close: float, high: float, low: float):
+        """
+        مثل crossed لكن مع حذف التنبيهات المفعّلة من الفهرس.
+        """
+        entry = self._by_instrument.get(instrument)
+        if entry is None:
+            return ()
+        rows = self._crossed_rows(entry, close, high, low)
+        if not rows:
+            return ()
+        alert_ids = array("q", [entry.alert_ids[i] for i in rows])
+        if rows[-1] - rows[0] + 1 == len(rows):
+            # الحالة الغالبة: شريحة متصلة واحدة
+            del entry.targets[rows[0]:rows[-1] + 1]
+            del entry.alert_ids[rows[0]:rows[-1] + 1]
+            del entry.since[rows[0]:rows[-1] + 1]
+        else:
+            for i in reversed(rows):
+                del entry.targets[i]
+                del entry.alert_ids[i]
+                del entry.since[i]
+        self._size -= len(alert_ids)
+        if not entry.targets:
+            del self._by_instrument[instrument]
+        return alert_ids
+
+    def last_observation(self, instrument):
+        """
+        آخر (إغلاق، أعلى، أدنى) تمت رؤيتها للأداة، أو None.
+        """
+        entry = self._by_instrument.get(instrument)
+        if entry is None or entry.last_close is None:
+            return None
+        return entry.last_close, entry.last_high, entry.last_low
+
+    def alert_ids(self, instrument):
+        entry = self._by_instrument.get(instrument)
+        return entry.alert_ids if entry is not None else ()
+
+    def targets(self, instrument):
+        entry = self._by_instrument.get(instrument)
+        return entry.targets if entry is not None else ()
+
+    def instruments(self):
+        return list(self._by_instrument)
+
+    def instrument_count(self) -> int:
+        return len(self._by_instrument)
+
+    def count(self, instrument) -> int:
+        entry = self._by_instrument.get(instrument)
+        return len(entry.targets) if entry is not None else 0
+
+    def __len__(self):
+        return self._size
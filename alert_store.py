@@ -0,0 +1,150 @@
+from array import array
+from collections import Counter
+
+
+class AlertStore:
+    """
+    تخزين مضغوط للتنبيهات في أعمدة (array) بدلاً من قاموس لكل تنبيه:
+    السعر المستهدف float64، وأرقام التنبيه والدردشة والمستخدم int64، ورقم الأداة int32.
+    كل أداة (symbol, screener, exchange) تُخزن مرة واحدة فقط ويشار إليها برقمها، ويُحرر رقمها
+    لإعادة استخدامه عند حذف آخر تنبيه عليها.
+    الإضافة والحذف برقم التنبيه في O(1)؛ الحذف ينقل آخر صف إلى مكان الصف المحذوف.
+    """
+
+    def __init__(self):
+        self._row = {}  # alert_id -> رقم الصف
+        self._alert_ids = array("q")
+        self._targets = array("d")
+        self._chat_ids = array("q")
+        self._user_ids = array("q")
+        self._instrument_ids = array("i")
+        self._instrument_id = {}  # instrument -> رقمه
+        self._instruments = []    # رقم الأداة -> instrument (None للأرقام المحررة)
+        self._instrument_refs = array("q")  # رقم الأداة -> عدد التنبيهات عليها
+        self._free_instruments = []  # أرقام محررة يُعاد استخدامها
+
+    def _intern(self, instrument, count=1):
+        instrument_id = self._instrument_id.get(instrument)
+        if instrument_id is None:
+            if self._free_instruments:
+                instrument_id = self._free_instruments.pop()
+                self._instruments[instrument_id] = instrument
+            else:
+                instrument_id = len(self._instruments)
+                self._instruments.append(instrument)
+                self._instrument_refs.append(0)
+            self._instrument_id[instrument] = instrument_id
+        self._instrument_refs[instrument_id] += count
+        return instrument_id
+
+    def _release(self, instrument_id):
+        self._instrument_refs[instrument_id] -= 1
+        if not self._instrument_refs[instrument_id]:
+            del self._instrument_id[self._instruments[instrument_id]]
+            self._instruments[instrument_id] = None
+            self._free_instruments.append(instrument_id)
+
+    def add(self, alert_obj):
+        """
+        إضافة تنبيه من قاموس بنفس مفاتيح قاعدة البيانات (أو استبداله إذا كان رقمه موجوداً).
+        """
+        self.add_row(
+            alert_obj["alert_id"], alert_obj["screener"], alert_obj["exchange"], alert_obj["symbol"],
+            alert_obj["target_price"], alert_obj["chat_id"], alert_obj["user_id"]
+        )
+
+    def add_row(self, alert_id, screener, exchange, symbol, target_price, chat_id, user_id):
+        """
+        نفس add لكن من صف بترتيب أعمدة جدول alerts (لتحميل ملايين التنبيهات دون بناء قواميس).
+        """
+        if alert_id in self._row:
+            self.pop(alert_id)
+        self._row[alert_id] = len(self._alert_ids)
+        self._alert_ids.append(alert_id)
+        self._targets.append(target_price)
+        self._chat_ids.append(chat_id)
+        self._user_ids.append(user_id)
+        self._instrument_ids.append(self._intern((symbol, screener, exchange)))
+
+    def extend(self, alert_ids, instruments, targets, chat_ids, user_ids):
+        """
+        إضافة دفعة من التنبيهات كأعمدة متوازية بتمديد الأعمدة مرة واحدة بدلاً من صف بصف
+        (لتحميل التنبيهات عند بدء التشغيل).
+        """
+        for alert_id in self._row.keys() & set(alert_ids):
+            self.pop(alert_id)
+        # كل أداة تُسجل مرة واحدة للدفعة كلها مع عدد تنبيهاتها فيها
+        instrument_ids = {
+            instrument: self._intern(instrument, count) for instrument, count in Counter(instruments).items()
+        }
+        start = len(self._alert_ids)
+        self._row.update(zip(alert_ids, range(start, start + len(alert_ids))))
+        self._alert_ids.extend(alert_ids)
+        self._targets.extend(targets)
+        self._chat_ids.extend(chat_ids)
+        self._user_ids.extend(user_ids)
+        self._instrument_ids.extend([instrument_ids[instrument] for instrument in instruments])
+
+    def _record(self, row):
+        symbol, screener, exchange = self._instruments[self._instrument_ids[row]]
+        return {
+            "alert_id": self._alert_ids[row],
+            "screener": screener,
+            "exchange": exchange,
+            "symbol": symbol,
+            "target_price": self._targets[row],
+            "chat_id": self._chat_ids[row],
+            "user_id": self._user_ids[row]
+        }
+
+    def get(self, alert_id, default=None):
+        """
+        التنبيه كقاموس (يُبنى عند الطلب؛ تعديله لا يغير المخزن).
+        """
+        row = self._row.get(alert_id)
+        return default if row is None else self._record(row)
+
+    def pop(self, alert_id, default=None):
+        row = self._row.pop(alert_id, None)
+        if row is None:
+            return default
+        alert_obj = self._record(row)
+        self._release(self._instrument_ids[row])
+        last = len(self._alert_ids) - 1
+        if row != last:
+            moved_id = self._alert_ids[last]
+            for column in (self._alert_ids, self._targets, self._chat_ids, self._user_ids, self._instrument_ids):
+                column[row] = column[last]
+            self._row[moved_id] = row
+        for column in (self._alert_ids, self._targets, self._chat_ids, self._user_ids, self._instrument_ids):
+            column.pop()
+        return alert_obj
+
+    def instrument(self, alert_id):
+        row = self._row.get(alert_id)
+        return None if row is None else self._instruments[self._instrument_ids[row]]
+
+    def target(self, alert_id):
+        row = self._row.get(alert_id)
+        return None if row is None else self._targets[row]
+
+    def by_instrument(self):
+        """
+        التنبيهات مجمعة حسب الأداة: instrument -> [(target_price, alert_id), ...]
+        """
+        grouped = {}
+        for instrument_id, target, alert_id in zip(self._instrument_ids, self._targets, self._alert_ids):
+            grouped.setdefault(instrument_id, []).append((target, alert_id))
+        return {self._instruments[instrument_id]: pairs for instrument_id, pairs in grouped.items()}
+
+    def clear(self):
+        self.__init__()
+
+    def __len__(self):
+        return len(self._alert_ids)
+
+    def __contains__(self, alert_id):
+        return alert_id in self._row
+
+    def __iter__(self):
+        return iter(list(self._alert_ids))
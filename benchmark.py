@@ -0,0 +1,250 @@
+"""
+قياس أداء البوت دون الاتصال بـ TradingView أو Telegram.
+
+يشغّل خادم scanner محلياً (fake_scanner.py)، ويملأ البوت بعدد كبير من التنبيهات الوهمية،
+ثم يقيس زمن دورة check_prices وعدد الطلبات لكل دورة، وزمن استجابة enter_symbol أثناء تشغيل الدورات،
+وأعلى استهلاك للذاكرة.
+
+افتراضياً تُحمّل قائمة الرموز المحلية من الخادم الوهمي كما يحدث عند تشغيل البوت: الرموز الصحيحة تُعرف
+بدون طلبات، والخاطئة تُتحقق عبر الشبكة ثم تُقترح لها رموز من القائمة. مع --no-catalog تبقى القائمة فارغة،
+فكل رمز يُتحقق منه عبر الشبكة والرموز الخاطئة تمر عبر search_symbol_across_all.
+
+مثال:
+    python benchmark.py --alerts 1000,10000,100000 --instruments 500 --latency 0.1
+    python benchmark.py --alerts 10000 --no-catalog
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import argparse
+import resource
+import tempfile
+import statistics
+import types
+
+from fake_scanner import FakeScanner, base_price
+
+SCREENER_EXCHANGES = {
+    "crypto": ["BINANCE", "BITFINEX", "KRAKEN", "COINBASE", "BITSTAMP", "MEXC"],
+    "forex": ["OANDA", "FX", "PEPPERSTONE", "FOREXCOM"],
+    "cfd": ["TVC", "CAPITALCOM"],
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for the price alert bot.")
+    parser.add_argument("--alerts", default="1000,10000,100000", help="comma separated alert populations")
+    parser.add_argument("--instruments", type=int, default=500, help="distinct instruments per population")
+    parser.add_argument("--cycles", type=int, default=3, help="price check cycles per population")
+    parser.add_argument("--commands", type=int, default=50, help="enter_symbol commands per population")
+    parser.add_argument("--typo-rate", type=float, default=0.2, help="share of commands with an unknown symbol")
+    parser.add_argument("--latency", type=float, default=0.05, help="fake scanner latency (seconds)")
+    parser.add_argument("--jitter", type=float, default=0.02, help="fake scanner latency jitter (seconds)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of scanner requests that fail")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-catalog", dest="catalog", action="store_false",
+                        help="do not preload the symbol catalog (live validation and search_symbol_across_all)")
+    parser.add_argument("--json", dest="json_path", help="also write the results as JSON to this path")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's own logging")
+    return parser.parse_args(argv)
+
+
+def build_catalog(count, rng):
+    """
+    قائمة أدوات وهمية (symbol, screener, exchange) موزعة على عدة screeners وexchanges.
+    """
+    instruments = []
+    for i in range(count):
+        screener = rng.choice(list(SCREENER_EXCHANGES))
+        exchange = rng.choice(SCREENER_EXCHANGES[screener])
+        instruments.append((f"SYM{i}USD", screener, exchange))
+    catalog = {}
+    for symbol, screener, exchange in instruments:
+        catalog.setdefault(screener, set()).add(f"{exchange}:{symbol}")
+    return instruments, catalog
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def peak_rss_mb():
+    # ru_maxrss بالكيلوبايت على Linux وبالبايت على macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def fake_update(text, user_id):
+    return types.SimpleNamespace(
+        message=FakeMessage(text),
+        effective_user=types.SimpleNamespace(id=user_id, username=None, first_name="bench"),
+        effective_chat=types.SimpleNamespace(id=user_id),
+    )
+
+
+def reset_bot(bot):
+    """
+    إعادة البوت إلى حالة فارغة بين مجموعات القياس.
+    """
+    bot.alerts.clear()
+    bot.condition_alerts.clear()
+    bot.user_alerts.clear()
+    bot.engine = bot.PriceEngine(fetcher=bot.fetcher, resolver=bot.resolver)
+    bot.dispatcher = bot.NotificationDispatcher()
+    bot.resolver.cache.clear()
+
+
+def populate(bot, instruments, alert_count, rng):
+    for i in range(alert_count):
+        symbol, screener, exchange = rng.choice(instruments)
+        base = base_price(f"{exchange}:{symbol}")
+        # أغلب الأهداف بعيدة عن السعر، وجزء صغير قريب منه ليتم تفعيله
+        spread = 0.002 if rng.random() < 0.01 else rng.uniform(0.02, 0.5)
+        target = round(base * (1 + rng.choice((-1, 1)) * spread), 4)
+        bot.add_alert({
+            "alert_id": bot.storage.next_alert_id(),
+            "screener": screener,
+            "exchange": exchange,
+            "symbol": symbol,
+            "target_price": target,
+            "chat_id": i % 5000,
+            "user_id": i % 5000,
+        })
+
+
+async def run_commands(bot, instruments, count, typo_rate, rng, stop_event):
+    """
+    تنفيذ enter_symbol بشكل متكرر أثناء دورات الفحص وقياس زمن كل أمر.
+    """
+    latencies = []
+    searches = []
+    for i in range(count):
+        symbol, screener, exchange = rng.choice(instruments)
+        typo = rng.random() < typo_rate
+        text = symbol[:-1] if typo else symbol
+        context = types.SimpleNamespace(user_data={"screener": screener, "exchange": exchange}, args=[])
+        started = time.perf_counter()
+        await bot.enter_symbol(fake_update(text, 10_000_000 + i), context)
+        elapsed = time.perf_counter() - started
+        (searches if typo else latencies).append(elapsed)
+        if stop_event.is_set() and i >= count // 2:
+            break
+        await asyncio.sleep(0.01)
+    return latencies, searches
+
+
+async def run_population(bot, scanner, instruments, alert_count, args, rng):
+    reset_bot(bot)
+    started = time.perf_counter()
+    populate(bot, instruments, alert_count, rng)
+    populate_seconds = time.perf_counter() - started
+    instrument_count = len(bot.engine.instruments())
+    context = types.SimpleNamespace(application=types.SimpleNamespace(bot=None))
+
+    stop_event = asyncio.Event()
+    commands = asyncio.ensure_future(run_commands(bot, instruments, args.commands, args.typo_rate, rng, stop_event))
+
+    cycle_times = []
+    calls_per_cycle = []
+    for _ in range(args.cycles):
+        # كل الأدوات مستحقة للفحص في كل دورة قياس
+        bot.engine.wake_all()
+        scanner.reset_counters()
+        started = time.perf_counter()
+        await bot.check_prices(context)
+        cycle_times.append(time.perf_counter() - started)
+        calls_per_cycle.append(scanner.requests)
+    stop_event.set()
+    latencies, searches = await commands
+
+    return {
+        "alerts": alert_count,
+        "instruments": instrument_count,
+        "populate_s": round(populate_seconds, 3),
+        "cycle_s_mean": round(statistics.mean(cycle_times), 4),
+        "cycle_s_max": round(max(cycle_times), 4),
+        "upstream_calls_per_cycle": round(statistics.mean(calls_per_cycle), 1),
+        "triggered_pending": bot.dispatcher.queue_depth,
+        "command_p50_ms": _ms(percentile(latencies, 0.5)),
+        "command_p99_ms": _ms(percentile(latencies, 0.99)),
+        "search_p50_ms": _ms(percentile(searches, 0.5)),
+        "search_p99_ms": _ms(percentile(searches, 0.99)),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 1)
+
+
+def print_table(results):
+    columns = list(results[0])
+    widths = [max(len(c), *(len(str(r[c])) for r in results)) for c in columns]
+    print("  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in results:
+        print("  ".join(str(row[c]).ljust(w) for c, w in zip(columns, widths)))
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    instruments, catalog = build_catalog(args.instruments, rng)
+    scanner = FakeScanner(catalog, latency=args.latency, jitter=args.jitter,
+                          error_rate=args.error_rate, seed=args.seed).start()
+
+    # يجب ضبط البيئة قبل استيراد البوت: قاعدة بيانات مؤقتة وميزانية طلبات غير محدودة
+    tmpdir = tempfile.mkdtemp(prefix="bot-bench-")
+    os.environ["DB_PATH"] = os.path.join(tmpdir, "bench.db")
+    os.environ.setdefault("REQUESTS_PER_MINUTE", "1000000")
+    os.environ.setdefault("TELEGRAM_TOKEN", "bench")
+    import Telegrambot as bot
+    from tradingview_ta import TradingView
+    TradingView.scan_url = scanner.url
+    logging.basicConfig(
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO if args.verbose else logging.CRITICAL
+    )
+
+    bot.init_services()
+    bot.storage.open()
+    # قائمة الرموز المحلية تُحمّل من الخادم الوهمي كما يحدث عند تشغيل البوت
+    if args.catalog:
+        await bot.refresh_symbol_catalog(None)
+    results = []
+    try:
+        for alert_count in [int(n) for n in args.alerts.split(",") if n.strip()]:
+            result = await run_population(bot, scanner, instruments, alert_count, args, rng)
+            results.append(result)
+            print(json.dumps(result), file=sys.stderr)
+    finally:
+        bot.storage.close()
+        scanner.stop()
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+    print_table(results)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import os
+import time
+
+# التأخير بعد أول فشل لأداة، والحد الأقصى للتأخير المتزايد (بالثواني)
+BACKOFF_BASE = float(os.getenv("BACKOFF_BASE", "30"))
+BACKOFF_MAX = float(os.getenv("BACKOFF_MAX", "1800"))
+# بعد كم ثانية من الفشل المتواصل تُعزل الأداة، وكل كم ثانية تُجرّب الأداة المعزولة
+QUARANTINE_AFTER = float(os.getenv("QUARANTINE_AFTER", str(6 * 3600)))
+QUARANTINE_PROBE_INTERVAL = float(os.getenv("QUARANTINE_PROBE_INTERVAL", str(6 * 3600)))
+# الـ exchange يُعتبر متوقفاً إذا فشلت BREAKER_THRESHOLD أدوات مختلفة على الأقل، وكانت نسبة الأدوات الفاشلة
+# من الأدوات التي فُحصت خلال آخر BREAKER_WINDOW ثانية لا تقل عن BREAKER_FAILURE_RATIO
+BREAKER_THRESHOLD = int(os.getenv("BREAKER_THRESHOLD", "3"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.8"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "600"))
+# مدة الإيقاف الأولى والحد الأقصى لها (بالثواني)
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "120"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN", "1800"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+class InstrumentFailures:
+    __slots__ = ("count", "first_failure_at", "quarantined")
+
+    def __init__(self, now: float):
+        self.count = 0
+        self.first_failure_at = now
+        self.quarantined = False
+
+
+class FailureTracker:
+    """
+    تأخير متزايد (exponential backoff) لكل أداة يفشل جلبها، وعزل الأداة بعد فشل طويل متواصل.
+    """
+
+    def __init__(self, base=BACKOFF_BASE, maximum=BACKOFF_MAX, quarantine_after=QUARANTINE_AFTER,
+                 probe_interval=QUARANTINE_PROBE_INTERVAL):
+        self.base = base
+        self.maximum = maximum
+        self.quarantine_after = quarantine_after
+        self.probe_interval = probe_interval
+        self._failures = {}
+
+    def failure(self, instrument, now=None):
+        """
+        تسجيل فشل؛ يعيد (التأخير قبل المحاولة التالية، هل تم عزل الأداة الآن لأول مرة).
+        """
+        now = time.monotonic() if now is None else now
+        state = self._failures.get(instrument)
+        if state is None:
+            state = self._failures[instrument] = InstrumentFailures(now)
+        state.count += 1
+        newly_quarantined = False
+        if not state.quarantined and now - state.first_failure_at >= self.quarantine_after:
+            state.quarantined = newly_quarantined = True
+        if state.quarantined:
+            return self.probe_interval, newly_quarantined
+        return min(self.maximum, self.base * 2 ** (state.count - 1)), False
+
+    def success(self, instrument) -> bool:
+        """
+        تسجيل نجاح؛ يعيد True إذا كانت الأداة معزولة وعادت للعمل.
+        """
+        state = self._failures.pop(instrument, None)
+        return state is not None and state.quarantined
+
+    def failures(self, instrument) -> int:
+        state = self._failures.get(instrument)
+        return state.count if state is not None else 0
+
+    def is_quarantined(self, instrument) -> bool:
+        state = self._failures.get(instrument)
+        return state is not None and state.quarantined
+
+    def forget(self, instrument):
+        self._failures.pop(instrument, None)
+
+    def quarantined_count(self) -> int:
+        return sum(1 for state in self._failures.values() if state.quarantined)
+
+
+class ExchangeCircuit:
+    __slots__ = ("state", "outcomes", "open_until", "cooldown")
+
+    def __init__(self, cooldown: float):
+        self.state = CLOSED
+        self.outcomes = {}  # instrument -> (آخر نتيجة: نجاح أم لا، وقتها)
+        self.open_until = 0.0
+        self.cooldown = cooldown
+
+    def failing(self, instrument) -> bool:
+        outcome = self.outcomes.get(instrument)
+        return outcome is not None and not outcome[0]
+
+
+class ExchangeBreaker:
+    """
+    قاطع دائرة لكل exchange يعتمد على آخر نتيجة لكل أداة مختلفة خلال نافذة زمنية، لا على نتائج دورة واحدة:
+    أداة واحدة محذوفة (تُعاد محاولتها بتأخير متزايد) لا توقف exchange أدواته الأخرى تعمل.
+    عند التوقف لا نطلب أدوات الـ exchange، وبعد مدة الإيقاف نسمح بأداة واحدة للتجربة (half-open)
+    يُفضل أن تكون أداة لم تفشل من قبل. نجاح التجربة يعيد فتح الـ exchange، وفشلها يضاعف مدة الإيقاف.
+    """
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, ratio=BREAKER_FAILURE_RATIO, window=BREAKER_WINDOW,
+                 cooldown=BREAKER_COOLDOWN, max_cooldown=BREAKER_MAX_COOLDOWN):
+        self.threshold = threshold
+        self.ratio = ratio
+        self.window = window
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self._circuits = {}
+
+    def _circuit(self, exchange):
+        circuit = self._circuits.get(exchange)
+        if circuit is None:
+            circuit = self._circuits[exchange] = ExchangeCircuit(self.cooldown)
+        return circuit
+
+    def filter(self, instruments, now=None):
+        """
+        الأدوات المسموح بطلبها الآن: كل أدوات الـ exchanges المغلقة، وأداة تجربة واحدة لكل exchange نصف مفتوح.
+        """
+        now = time.monotonic() if now is None else now
+        allowed = []
+        probes = {}  # exchange -> أداة التجربة
+        for instrument in instruments:
+            exchange = instrument[2]
+            circuit = self._circuits.get(exchange)
+            if circuit is None or circuit.state == CLOSED:
+                allowed.append(instrument)
+                continue
+            if circuit.state == OPEN and now >= circuit.open_until:
+                circuit.state = HALF_OPEN
+            if circuit.state != HALF_OPEN:
+                continue
+            # أول أداة مستحقة، إلا إذا كانت فاشلة وتوجد بعدها أداة لم تفشل
+            probe = probes.get(exchange)
+            if probe is None or (circuit.failing(probe) and not circuit.failing(instrument)):
+                probes[exchange] = instrument
+        return allowed + list(probes.values())
+
+    def report(self, exchange, results, now=None):
+        """
+        نتائج دورة واحدة لـ exchange معين: instrument -> هل نجح جلبها.
+        يعيد الحالة الجديدة إذا تغيرت، وإلا None.
+        """
+        now = time.monotonic() if now is None else now
+        circuit = self._circuit(exchange)
+        previous = circuit.state
+        for instrument, ok in results.items():
+            circuit.outcomes[instrument] = (ok, now)
+        if circuit.state == HALF_OPEN:
+            if any(results.values()):
+                circuit.state = CLOSED
+                circuit.cooldown = self.cooldown
+                # بداية جديدة: الفشل القديم لا يعيد فتح الدائرة فوراً
+                circuit.outcomes = {instrument: outcome for instrument, outcome in circuit.outcomes.items() if outcome[0]}
+            elif results:
+                circuit.cooldown = min(self.max_cooldown, circuit.cooldown * 2)
+                circuit.state = OPEN
+                circuit.open_until = now + circuit.cooldown
+        elif circuit.state == CLOSED:
+            circuit.outcomes = {
+                instrument: outcome for instrument, outcome in circuit.outcomes.items()
+                if now - outcome[1] <= self.window
+            }
+            failing = sum(1 for ok, _ in circuit.outcomes.values() if not ok)
+            if failing >= self.threshold and failing >= self.ratio * len(circuit.outcomes):
+                circuit.state = OPEN
+                circuit.open_until = now + circuit.cooldown
+        return circuit.state if circuit.state != previous else None
+
+    def forget(self, instrument):
+        circuit = self._circuits.get(instrument[2])
+        if circuit is not None:
+            circuit.outcomes.pop(instrument, None)
+
+    def state(self, exchange):
+        circuit = self._circuits.get(exchange)
+        return circuit.state if circuit is not None else CLOSED
+
+    def open_count(self) -> int:
+        return sum(1 for circuit in self._circuits.values() if circuit.state != CLOSED)
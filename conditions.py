@@ -0,0 +1,335 @@
+"""
+لغة شروط التنبيهات، مثل:
+    RSI < 30
+    close crosses_above EMA50@4h
+    change@1h > 2 and RSI@15m > 70
+
+كل طرف إما رقم أو مؤشر من مؤشرات TradingView مع فترة زمنية اختيارية بعد @ (الافتراضي 1h).
+change هو نسبة التغير (%) خلال شمعة الفترة المحددة. crosses_above/crosses_below تقارن بالقراءة السابقة للأداة.
+الشرط يُترجم مرة واحدة إلى أعمدة scanner، وكل الشروط تُقيّم معاً بـ numpy على لقطة واحدة لكل أداة.
+"""
+import re
+from array import array
+
+import numpy as np
+from tradingview_ta import TradingView, Interval
+
+from market_data import column
+
+# الفترة الزمنية عندما لا يحدد المستخدم @
+DEFAULT_INTERVAL = Interval.INTERVAL_1_HOUR
+# الحد الأقصى لعدد الشروط المربوطة بـ and في تنبيه واحد
+MAX_CLAUSES = 4
+
+INTERVALS = {
+    "1m": Interval.INTERVAL_1_MINUTE,
+    "5m": Interval.INTERVAL_5_MINUTES,
+    "15m": Interval.INTERVAL_15_MINUTES,
+    "30m": Interval.INTERVAL_30_MINUTES,
+    "1h": Interval.INTERVAL_1_HOUR,
+    "2h": Interval.INTERVAL_2_HOURS,
+    "4h": Interval.INTERVAL_4_HOURS,
+    "1d": Interval.INTERVAL_1_DAY,
+    "1w": Interval.INTERVAL_1_WEEK,
+    "1M": Interval.INTERVAL_1_MONTH,
+}
+
+# أسماء المؤشرات المسموحة (بدون أحرف كبيرة/صغيرة) -> اسم العمود في TradingView
+INDICATORS = {name.lower(): name for name in TradingView.indicators if "[" not in name}
+INDICATORS["price"] = "close"
+INDICATORS["macd"] = "MACD.macd"
+
+LT, LE, GT, GE, CROSS_ABOVE, CROSS_BELOW = range(6)
+OPERATORS = {
+    "<": LT, "<=": LE, ">": GT, ">=": GE,
+    "crosses_above": CROSS_ABOVE, "crosses_below": CROSS_BELOW,
+}
+OPERATOR_TEXT = {code: text for text, code in OPERATORS.items()}
+
+_TOKEN = re.compile(
+    r"\s*(crosses[ _]above|crosses[ _]below|<=|>=|<|>"
+    r"|-?\d+(?:\.\d+)?"
+    r"|[A-Za-z][A-Za-z0-9.+\-]*(?:@\w+)?)",
+    re.IGNORECASE
+)
+_NUMBER = re.compile(r"-?\d+(?:\.\d+)?$")
+
+
+class ConditionError(ValueError):
+    pass
+
+
+class Condition:
+    """
+    شرط مُترجم: قائمة (left, operator, right) حيث كل طرف رقم (float) أو اسم عمود scanner (str).
+    """
+    __slots__ = ("text", "clauses")
+
+    def __init__(self, text, clauses):
+        self.text = text
+        self.clauses = clauses
+
+    @property
+    def columns(self):
+        return sorted({side for left, _, right in self.clauses for side in (left, right) if isinstance(side, str)})
+
+
+def _tokenize(text):
+    tokens = []
+    position = 0
+    text = text.strip()
+    while position < len(text):
+        match = _TOKEN.match(text, position)
+        if not match or not match.group(1):
+            raise ConditionError(f"لم أفهم الشرط بعد: {text[position:].strip()}")
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+def _operand(token):
+    if _NUMBER.match(token):
+        return float(token), token
+    name, _, interval = token.partition("@")
+    indicator = INDICATORS.get(name.lower())
+    if indicator is None:
+        raise ConditionError(f"مؤشر غير معروف: {name}")
+    if interval:
+        key = interval if interval in INTERVALS else interval.lower()
+        if key not in INTERVALS:
+            raise ConditionError(f"فترة زمنية غير معروفة: {interval} (المتاح: {', '.join(INTERVALS)})")
+    else:
+        key = next(k for k, v in INTERVALS.items() if v == DEFAULT_INTERVAL)
+    return column(indicator, INTERVALS[key]), f"{indicator}@{key}"
+
+
+def compile_condition(text: str) -> Condition:
+    """
+    ترجمة نص الشرط؛ يرفع ConditionError برسالة للمستخدم إذا كان غير صالح.
+    """
+    tokens = _tokenize(text)
+    clauses = []
+    parts = []
+    i = 0
+    while True:
+        if i + 3 > len(tokens):
+            raise ConditionError("الشرط يجب أن يكون بالصيغة: مؤشر مقارنة قيمة (مثلاً RSI < 30)")
+        left, operator, right = tokens[i:i + 3]
+        code = OPERATORS.get(operator.lower().replace(" ", "_"))
+        if code is None:
+            raise ConditionError(f"مقارنة غير معروفة: {operator} (المتاح: <, <=, >, >=, crosses_above, crosses_below)")
+        left, left_text = _operand(left)
+        right, right_text = _operand(right)
+        if not isinstance(left, str) and not isinstance(right, str):
+            raise ConditionError("يجب أن يحتوي كل شرط على مؤشر واحد على الأقل")
+        clauses.append((left, code, right))
+        parts.append(f"{left_text} {OPERATOR_TEXT[code]} {right_text}")
+        i += 3
+        if i == len(tokens):
+            break
+        if tokens[i].lower() != "and" or i + 1 == len(tokens):
+            raise ConditionError("يمكن ربط الشروط بـ and فقط")
+        i += 1
+        if len(clauses) == MAX_CLAUSES:
+            raise ConditionError(f"الحد الأقصى {MAX_CLAUSES} شروط في التنبيه الواحد")
+    return Condition(" and ".join(parts), clauses)
+
+
+class ConditionAlert:
+    __slots__ = ("alert_id", "instrument", "condition", "chat_id", "user_id", "clause_rows")
+
+    def __init__(self, alert_id, instrument, condition, chat_id, user_id):
+        self.alert_id = alert_id
+        self.instrument = instrument
+        self.condition = condition
+        self.chat_id = chat_id
+        self.user_id = user_id
+        self.clause_rows = []
+
+
+class ConditionBook:
+    """
+    تنبيهات الشروط مع تقييمها دفعة واحدة. كل شرط جزئي (clause) صف في أعمدة array:
+    رقم التنبيه، رقم الأداة، المقارنة، ولكل طرف رقم العمود (-1 للثابت) وقيمة الثابت.
+    التقييم يقرأ هذه الأعمدة مباشرة كمصفوفات numpy (بدون نسخ) ويقارنها بمصفوفة القيم الحالية
+    والسابقة لكل الأدوات، دون حلقة لكل تنبيه. الإضافة والحذف في O(عدد شروط التنبيه).
+    أرقام الأدوات والأعمدة التي لم يعد يستخدمها أي تنبيه يُعاد استخدامها، فحجم المصفوفات يتبع
+    أكبر عدد متزامن من الأدوات والأعمدة وليس كل ما مر على البوت.
+    """
+
+    def __init__(self):
+        self._alerts = {}         # alert_id -> ConditionAlert
+        self._by_instrument = {}  # instrument -> set(alert_id)
+        self._instrument_id = {}  # instrument -> رقم الصف في مصفوفة القيم
+        self._column_id = {}      # عمود scanner -> رقم العمود في مصفوفة القيم
+        self._free_instruments = []  # أرقام صفوف محررة يُعاد استخدامها
+        self._free_columns = []      # أرقام أعمدة محررة يُعاد استخدامها
+        self._column_users = {}   # عمود -> عدد الشروط التي تستخدمه
+        self._instrument_columns = {}  # instrument -> {عمود: عدد الشروط التي تستخدمه على هذه الأداة}
+        self._clause_alert = array("q")
+        self._clause_instrument = array("q")
+        self._ops = array("b")
+        self._left_col = array("q")
+        self._left_const = array("d")
+        self._right_col = array("q")
+        self._right_const = array("d")
+        self._clause_columns = (self._clause_alert, self._clause_instrument, self._ops,
+                                self._left_col, self._left_const, self._right_col, self._right_const)
+        # آخر قيم لكل أداة (لاكتشاف التقاطع)؛ العمود الأخير NaN دائماً ويُستخدم لأطراف الثوابت
+        self._previous = np.full((0, 1), np.nan)
+
+    @staticmethod
+    def _intern(mapping, free, key):
+        index = mapping.get(key)
+        if index is None:
+            index = free.pop() if free else len(mapping)
+            mapping[key] = index
+        return index
+
+    def _side(self, side, instrument_columns):
+        if isinstance(side, str):
+            self._column_users[side] = self._column_users.get(side, 0) + 1
+            instrument_columns[side] = instrument_columns.get(side, 0) + 1
+            return self._intern(self._column_id, self._free_columns, side), np.nan
+        return -1, side
+
+    def _release_side(self, side, instrument_columns):
+        if not isinstance(side, str):
+            return
+        instrument_columns[side] -= 1
+        if not instrument_columns[side]:
+            del instrument_columns[side]
+        self._column_users[side] -= 1
+        if not self._column_users[side]:
+            del self._column_users[side]
+            j = self._column_id.pop(side)
+            self._free_columns.append(j)
+            if j < self._previous.shape[1] - 1:
+                self._previous[:, j] = np.nan
+
+    def add(self, alert_id, instrument, condition: Condition, chat_id, user_id):
+        if alert_id in self._alerts:
+            self.remove(alert_id)
+        alert = self._alerts[alert_id] = ConditionAlert(alert_id, instrument, condition, chat_id, user_id)
+        self._by_instrument.setdefault(instrument, set()).add(alert_id)
+        instrument_id = self._intern(self._instrument_id, self._free_instruments, instrument)
+        instrument_columns = self._instrument_columns.setdefault(instrument, {})
+        for left, code, right in condition.clauses:
+            left_col, left_const = self._side(left, instrument_columns)
+            right_col, right_const = self._side(right, instrument_columns)
+            alert.clause_rows.append(len(self._clause_alert))
+            for column_values, value in zip(self._clause_columns, (alert_id, instrument_id, code, left_col,
+                                                                   left_const, right_col, right_const)):
+                column_values.append(value)
+
+    def remove(self, alert_id):
+        alert = self._alerts.pop(alert_id, None)
+        if alert is None:
+            return None
+        instrument_columns = self._instrument_columns[alert.instrument]
+        for left, _, right in alert.condition.clauses:
+            self._release_side(left, instrument_columns)
+            self._release_side(right, instrument_columns)
+        ids = self._by_instrument[alert.instrument]
+        ids.discard(alert_id)
+        if not ids:
+            # آخر تنبيه على الأداة: تحرير صفها لأداة أخرى
+            del self._by_instrument[alert.instrument]
+            del self._instrument_columns[alert.instrument]
+            row = self._instrument_id.pop(alert.instrument)
+            self._free_instruments.append(row)
+            if row < len(self._previous):
+                self._previous[row] = np.nan
+        # حذف صفوف الشروط بنقل آخر صف مكان كل صف محذوف (من الأكبر للأصغر)
+        for row in sorted(alert.clause_rows, reverse=True):
+            last = len(self._clause_alert) - 1
+            if row != last:
+                moved = self._alerts[self._clause_alert[last]]
+                for column_values in self._clause_columns:
+                    column_values[row] = column_values[last]
+                moved.clause_rows[moved.clause_rows.index(last)] = row
+            for column_values in self._clause_columns:
+                column_values.pop()
+        return alert
+
+    def get(self, alert_id):
+        return self._alerts.get(alert_id)
+
+    def alert_ids(self, instrument):
+        return sorted(self._by_instrument.get(instrument, ()))
+
+    def count(self, instrument) -> int:
+        return len(self._by_instrument.get(instrument, ()))
+
+    def instruments(self):
+        return list(self._by_instrument)
+
+    def columns(self, instruments=None):
+        """
+        أعمدة الـ scanner التي تحتاجها شروط هذه الأدوات (أو كل الأدوات).
+        """
+        if instruments is None:
+            return sorted(self._column_users)
+        needed = set()
+        for instrument in instruments:
+            needed.update(self._instrument_columns.get(instrument, ()))
+        return sorted(needed)
+
+    def __len__(self):
+        return len(self._alerts)
+
+    def _matrix(self, snapshots):
+        rows = len(self._instrument_id) + len(self._free_instruments)
+        values = np.full((rows, len(self._column_id) + len(self._free_columns) + 1), np.nan)
+        for instrument, snapshot in snapshots.items():
+            row = self._instrument_id.get(instrument)
+            if row is None or not snapshot:
+                continue
+            for name in self._instrument_columns[instrument]:
+                j = self._column_id[name]
+                value = snapshot.get(name)
+                if value is not None:
+                    values[row, j] = value
+        return values
+
+    def evaluate(self, snapshots):
+        """
+        snapshots: instrument -> {العمود: القيمة} للأدوات التي تم جلبها في هذه الدورة.
+        يعيد أرقام التنبيهات التي تحققت كل شروطها (بدون حذفها).
+        """
+        if not self._alerts or not snapshots:
+            return []
+        current = self._matrix(snapshots)
+        previous = np.full(current.shape, np.nan)
+        rows, cols = self._previous.shape
+        previous[:rows, :cols - 1] = self._previous[:, :-1]
+
+        clause_alert = np.frombuffer(self._clause_alert, dtype=np.int64)
+        instrument_rows = np.frombuffer(self._clause_instrument, dtype=np.int64)
+        ops = np.frombuffer(self._ops, dtype=np.int8)
+        left_col = np.frombuffer(self._left_col, dtype=np.int64)
+        right_col = np.frombuffer(self._right_col, dtype=np.int64)
+        left_const = np.frombuffer(self._left_const, dtype=np.float64)
+        right_const = np.frombuffer(self._right_const, dtype=np.float64)
+
+        # رقم العمود -1 يشير إلى العمود الأخير (NaN)، ثم يُستبدل بالثابت
+        left = np.where(left_col >= 0, current[instrument_rows, left_col], left_const)
+        right = np.where(right_col >= 0, current[instrument_rows, right_col], right_const)
+        previous_left = np.where(left_col >= 0, previous[instrument_rows, left_col], left_const)
+        previous_right = np.where(right_col >= 0, previous[instrument_rows, right_col], right_const)
+
+        with np.errstate(invalid="ignore"):
+            ok = np.select(
+                [ops == LT, ops == LE, ops == GT, ops == GE, ops == CROSS_ABOVE, ops == CROSS_BELOW],
+                [left < right, left <= right, left > right, left >= right,
+                 (previous_left <= previous_right) & (left > right),
+                 (previous_left >= previous_right) & (left < right)],
+                default=False
+            )
+        # التنبيه يتحقق عندما تتحقق كل شروطه (المقارنة مع NaN تعطي False دائماً)
+        triggered = np.setdiff1d(clause_alert[ok], clause_alert[~ok])
+
+        fetched = ~np.isnan(current[:, :-1]).all(axis=1)
+        previous[fetched] = current[fetched]
+        self._previous = previous
+        return triggered.tolist()
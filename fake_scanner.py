@@ -0,0 +1,139 @@
+"""
+خادم محلي يحاكي TradingView scanner لاختبارات الأداء دون الاتصال بـ TradingView.
+يدعم زمن استجابة قابل للضبط، ونسبة أخطاء، وقائمة رموز (catalog) لكل screener.
+"""
+import json
+import time
+import random
+import threading
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def base_price(ticker: str) -> float:
+    """
+    السعر الأساسي الثابت لرمز معين (ليتمكن المختبِر من اختيار أهداف قريبة أو بعيدة عنه).
+    """
+    return 1 + zlib.crc32(ticker.upper().encode()) % 100000 / 100.0
+
+
+class FakeScanner:
+    def __init__(self, catalog, latency=0.05, jitter=0.0, error_rate=0.0, volatility=0.005, seed=1):
+        """
+        catalog: قاموس screener -> مجموعة من EXCHANGE:SYMBOL الموجودة.
+        latency/jitter: زمن الاستجابة (بالثواني) وتذبذبه.
+        error_rate: نسبة الطلبات التي تعيد HTTP 500.
+        volatility: مدى الشمعة (high - low) كنسبة من السعر.
+        """
+        self.catalog = {screener: set(t.upper() for t in tickers) for screener, tickers in catalog.items()}
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.volatility = volatility
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.errors = 0
+        self.tickers_requested = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    # --------------------
+    # تشغيل الخادم
+    # --------------------
+    def start(self, host="127.0.0.1", port=0):
+        scanner = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                screener = self.path.strip("/").split("/")[0]
+                status, body = scanner.handle(screener, payload)
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-scanner", daemon=True)
+        self._thread.start()
+        return self
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = self.errors = self.tickers_requested = 0
+
+    # --------------------
+    # محاكاة الاستجابة
+    # --------------------
+    def handle(self, screener, payload):
+        tickers = payload.get("symbols", {}).get("tickers") or []
+        columns = payload.get("columns") or []
+        with self._lock:
+            self.requests += 1
+            self.tickers_requested += len(tickers)
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            failed = self.random.random() < self.error_rate
+            if failed:
+                self.errors += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return 500, {"error": "simulated failure"}
+        known = self.catalog.get(screener, set())
+        if not tickers:
+            return 200, self.listing(known, payload)
+        rows = []
+        for ticker in tickers:
+            ticker = ticker.upper()
+            if ticker in known:
+                price = self.price(ticker)
+                rows.append({"s": ticker, "d": [self.value(price, c) for c in columns]})
+        return 200, {"totalCount": len(rows), "data": rows}
+
+    def listing(self, known, payload):
+        # طلب قائمة الرموز (بدون tickers) مع فلتر exchange in_range ونطاق range
+        exchanges = None
+        for condition in payload.get("filter") or []:
+            if condition.get("left") == "exchange" and condition.get("operation") == "in_range":
+                exchanges = set(condition.get("right") or [])
+        start, end = (payload.get("range") or [0, len(known)])[:2]
+        matched = sorted(t for t in known if exchanges is None or t.split(":")[0] in exchanges)
+        rows = [{"s": t, "d": [t.split(":")[1]]} for t in matched[start:end]]
+        return {"totalCount": len(matched), "data": rows}
+
+    def price(self, ticker):
+        # سعر أساسي ثابت لكل رمز مع حركة عشوائية بسيطة بين الطلبات
+        return base_price(ticker) * (1 + self.random.uniform(-self.volatility, self.volatility))
+
+    def value(self, price, column):
+        name = column.split("|")[0]
+        if name == "high":
+            return price * (1 + self.volatility / 2)
+        if name == "low":
+            return price * (1 - self.volatility / 2)
+        if name in ("close", "open") or name.startswith(("EMA", "SMA", "VWMA", "HullMA", "BB.", "Pivot.", "P.SAR")):
+            return price
+        if name == "change":
+            return self.random.uniform(-3, 3)
+        if name == "volume":
+            return self.random.uniform(1e3, 1e6)
+        return self.random.uniform(0, 100)
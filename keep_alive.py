@@ -1,15 +1,78 @@
-from flask import Flask
-from threading import Thread
+import os
+import json
+import hmac
+import time
 
-app = Flask(__name__)
+import tornado.web
+from telegram import Update
 
-@app.route('/')
-def home():
-    return "✅ Bot is running!"
+import metrics
 
-def run():
-    app.run(host="0.0.0.0", port=8080)
+# المنفذ الذي يستمع عليه الخادم (مسارات الصحة والمقاييس، والـ webhook عند تفعيله)
+PORT = int(os.getenv("PORT", "8080"))
 
-def keep_alive():
-    t = Thread(target=run)
-    t.start()
+
+class HomeHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.write("✅ Bot is running!")
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    def get(self):
+        self.set_header("Content-Type", "text/plain; version=0.0.4")
+        self.write(metrics.render())
+
+
+class HealthHandler(tornado.web.RequestHandler):
+    def get(self):
+        healthy, age = metrics.health()
+        if age is None:
+            detail = f"no successful price cycle yet (started {time.time() - metrics.STARTED_AT:.0f}s ago)"
+        else:
+            detail = f"last successful price cycle {age:.0f}s ago"
+        self.set_status(200 if healthy else 503)
+        self.set_header("Content-Type", "text/plain")
+        self.write(f"{'ok' if healthy else 'unhealthy'}: {detail}\n")
+
+
+class WebhookHandler(tornado.web.RequestHandler):
+    """
+    استقبال التحديثات من Telegram ووضعها مباشرة في update_queue الخاص بالتطبيق.
+    """
+
+    def initialize(self, telegram_app, secret_token=None):
+        self.telegram_app = telegram_app
+        self.secret_token = secret_token
+
+    async def post(self):
+        if self.secret_token:
+            token = self.request.headers.get("X-Telegram-Bot-Api-Secret-Token", "")
+            # المقارنة على bytes: compare_digest يرفض النصوص غير ASCII (قد تأتي في أي ترويسة) بخطأ بدلاً من 403
+            if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+                raise tornado.web.HTTPError(403)
+        try:
+            update = Update.de_json(json.loads(self.request.body), self.telegram_app.bot)
+        except Exception:
+            raise tornado.web.HTTPError(400)
+        if update:
+            await self.telegram_app.update_queue.put(update)
+
+
+def make_app(application=None, webhook_path=None, secret_token=None):
+    routes = [
+        (r"/", HomeHandler),
+        (r"/metrics", MetricsHandler),
+        (r"/healthz", HealthHandler),
+    ]
+    if application is not None and webhook_path:
+        routes.append((rf"/{webhook_path.strip('/')}/?", WebhookHandler,
+                       {"telegram_app": application, "secret_token": secret_token}))
+    return tornado.web.Application(routes)
+
+
+def keep_alive(application=None, webhook_path=None, secret_token=None, port=PORT):
+    """
+    تشغيل خادم HTTP على نفس حلقة الأحداث الخاصة بالبوت (يجب استدعاؤها من داخل حلقة تعمل).
+    يعيد الخادم لإيقافه عند الإغلاق.
+    """
+    return make_app(application, webhook_path, secret_token).listen(port, address="0.0.0.0")
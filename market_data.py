@@ -0,0 +1,238 @@
+import os
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from tradingview_ta import TradingView, Interval, __version__ as TA_VERSION
+
+import metrics
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# الحد الأقصى لعدد الرموز في طلب scanner واحد
+MAX_TICKERS_PER_REQUEST = 200
+
+# الحد الأقصى لعدد الرموز التي تُجلب لكل screener عند تحديث قائمة الرموز المحلية
+CATALOG_LISTING_LIMIT = int(os.getenv("CATALOG_LISTING_LIMIT", "50000"))
+
+# الحد الأقصى لعدد طلبات الـ scanner المتزامنة، ومهلة كل طلب (بالثواني)
+MAX_CONCURRENT_FETCHES = int(os.getenv("MAX_CONCURRENT_FETCHES", "8"))
+FETCH_TIMEOUT = float(os.getenv("FETCH_TIMEOUT", "10"))
+
+# ذاكرة التحقق من الرموز: مدة بقاء النتائج الإيجابية والسلبية (بالثواني) والحجم الأقصى
+RESOLVE_TTL = float(os.getenv("RESOLVE_TTL", str(6 * 3600)))
+RESOLVE_NEGATIVE_TTL = float(os.getenv("RESOLVE_NEGATIVE_TTL", "600"))
+RESOLVE_CACHE_SIZE = int(os.getenv("RESOLVE_CACHE_SIZE", "50000"))
+
+# الفترة الزمنية المستخدمة لتنبيهات السعر
+PRICE_INTERVAL = Interval.INTERVAL_5_MINUTES
+
+# لاحقة كل فترة زمنية في أعمدة الـ scanner (نفس ما تستخدمه tradingview_ta)
+INTERVAL_SUFFIX = {
+    Interval.INTERVAL_1_MINUTE: "|1",
+    Interval.INTERVAL_5_MINUTES: "|5",
+    Interval.INTERVAL_15_MINUTES: "|15",
+    Interval.INTERVAL_30_MINUTES: "|30",
+    Interval.INTERVAL_1_HOUR: "|60",
+    Interval.INTERVAL_2_HOURS: "|120",
+    Interval.INTERVAL_4_HOURS: "|240",
+    Interval.INTERVAL_1_DAY: "",
+    Interval.INTERVAL_1_WEEK: "|1W",
+    Interval.INTERVAL_1_MONTH: "|1M",
+}
+
+
+def column(name: str, interval: str = PRICE_INTERVAL) -> str:
+    """
+    اسم عمود الـ scanner لمؤشر معين على فترة زمنية معينة (مثلاً: close|5).
+    """
+    return name + INTERVAL_SUFFIX[interval]
+
+
+PRICE_COLUMNS = [column("close"), column("high"), column("low")]
+
+
+def ticker_of(instrument) -> str:
+    """
+    تحويل الأداة (symbol, screener, exchange) إلى صيغة EXCHANGE:SYMBOL.
+    """
+    symbol, _screener, exchange = instrument
+    return f"{exchange}:{symbol}".upper()
+
+
+def fetch_batch(screener: str, tickers, columns=PRICE_COLUMNS, timeout=None):
+    """
+    جلب عدة رموز من نفس الـ screener بطلب scanner واحد (على نمط get_multiple_analysis).
+    يعيد قاموساً EXCHANGE:SYMBOL -> {العمود: القيمة} للرموز الموجودة فقط.
+    """
+    data = {
+        "symbols": {"tickers": [t.upper() for t in tickers], "query": {"types": []}},
+        "columns": list(columns),
+    }
+    scan_url = f"{TradingView.scan_url}{screener.lower()}/scan"
+    headers = {"User-Agent": f"tradingview_ta/{TA_VERSION}"}
+    response = requests.post(scan_url, json=data, headers=headers, timeout=timeout)
+    if response.status_code != 200:
+        raise Exception(f"Can't access TradingView's API. HTTP status code: {response.status_code}.")
+
+    results = {}
+    for row in response.json().get("data") or []:
+        results[row["s"]] = dict(zip(columns, row["d"]))
+    return results
+
+
+def fetch_listing(screener: str, exchanges, limit=CATALOG_LISTING_LIMIT, timeout=None):
+    """
+    قائمة كل الرموز المتاحة في screener معين على مجموعة exchanges (بدون تحديد رموز).
+    يعيد قائمة من (symbol, screener, exchange).
+    """
+    data = {
+        "filter": [{"left": "exchange", "operation": "in_range", "right": list(exchanges)}],
+        "symbols": {"query": {"types": []}, "tickers": []},
+        "columns": ["name"],
+        "range": [0, limit],
+    }
+    scan_url = f"{TradingView.scan_url}{screener.lower()}/scan"
+    headers = {"User-Agent": f"tradingview_ta/{TA_VERSION}"}
+    response = requests.post(scan_url, json=data, headers=headers, timeout=timeout)
+    if response.status_code != 200:
+        raise Exception(f"Can't access TradingView's API. HTTP status code: {response.status_code}.")
+
+    results = []
+    for row in response.json().get("data") or []:
+        exchange, _, symbol = row["s"].partition(":")
+        if symbol:
+            results.append((symbol, screener, exchange))
+    return results
+
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def group_by_screener(instruments):
+    """
+    تجميع الأدوات حسب الـ screener مع تقسيمها إلى دفعات لا تتجاوز MAX_TICKERS_PER_REQUEST.
+    يعيد قائمة من (screener, [instrument, ...]).
+    """
+    by_screener = {}
+    for instrument in instruments:
+        by_screener.setdefault(instrument[1], []).append(instrument)
+    batches = []
+    for screener, items in by_screener.items():
+        for chunk in chunked(items, MAX_TICKERS_PER_REQUEST):
+            batches.append((screener, chunk))
+    return batches
+
+
+class AsyncFetcher:
+    """
+    طبقة جلب غير متزامنة: تُنفّذ طلبات الـ scanner المتزامنة في thread pool
+    حتى لا تُوقف حلقة الأحداث، مع حد أقصى للطلبات المتزامنة ومهلة لكل طلب.
+    """
+
+    def __init__(self, max_concurrency=MAX_CONCURRENT_FETCHES, timeout=FETCH_TIMEOUT):
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="tv-fetch")
+
+    async def fetch_batch(self, screener, tickers, columns=PRICE_COLUMNS):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            started = time.perf_counter()
+            status = "error"
+            try:
+                future = loop.run_in_executor(self.executor, fetch_batch, screener, tickers, columns, self.timeout)
+                rows = await asyncio.wait_for(future, self.timeout + 1)
+                status = "ok"
+                return rows
+            finally:
+                elapsed = time.perf_counter() - started
+                metrics.UPSTREAM_REQUESTS.inc(screener=screener, status=status)
+                for exchange in {ticker.split(":")[0] for ticker in tickers}:
+                    metrics.UPSTREAM_FETCH_DURATION.observe(elapsed, screener=screener, exchange=exchange)
+
+    async def fetch_listing(self, screener, exchanges):
+        async with self.semaphore:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, fetch_listing, screener, exchanges,
+                                          CATALOG_LISTING_LIMIT, self.timeout * 3)
+            return await asyncio.wait_for(future, self.timeout * 3 + 1)
+
+    async def fetch_instruments(self, instruments, columns=PRICE_COLUMNS):
+        """
+        جلب بيانات مجموعة أدوات فريدة بأقل عدد ممكن من طلبات الـ scanner، مع تنفيذ الدفعات بالتوازي.
+        يعيد قاموساً instrument -> {العمود: القيمة}، أو None إذا لم يتم العثور عليها.
+        الأدوات التي فشل طلبها لا تظهر في القاموس.
+        """
+        batches = group_by_screener(instruments)
+        outcomes = await asyncio.gather(
+            *(self.fetch_batch(screener, [ticker_of(i) for i in batch], columns) for screener, batch in batches),
+            return_exceptions=True
+        )
+        results = {}
+        for (screener, batch), rows in zip(batches, outcomes):
+            if isinstance(rows, BaseException):
+                # المستدعي يقرر ماذا يسجل (المحرك يسجل أول فشل متواصل وعودة الطلبات فقط)
+                logger.debug(f"خطأ في جلب دفعة من {len(batch)} رمز من {screener}: {rows!r}")
+                continue
+            for instrument in batch:
+                results[instrument] = rows.get(ticker_of(instrument))
+        return results
+
+    async def fetch_one(self, instrument, columns=PRICE_COLUMNS):
+        """
+        جلب أداة واحدة؛ يعيد None إذا لم يتم العثور عليها أو فشل الطلب.
+        """
+        results = await self.fetch_instruments([instrument], columns)
+        return results.get(instrument)
+
+
+class SymbolResolver:
+    """
+    التحقق من وجود الأدوات مع ذاكرة مشتركة بين المستخدمين مفتاحها (candidate, screener, exchange).
+    النتائج الإيجابية تبقى لساعات، والسلبية لدقائق فقط، وفشل الطلب نفسه لا يُخزَّن.
+    """
+
+    def __init__(self, fetcher: AsyncFetcher, maxsize=RESOLVE_CACHE_SIZE,
+                 ttl=RESOLVE_TTL, negative_ttl=RESOLVE_NEGATIVE_TTL):
+        self.fetcher = fetcher
+        self.negative_ttl = negative_ttl
+        self.cache = TTLCache(maxsize, ttl)
+
+    @staticmethod
+    def key(instrument):
+        symbol, screener, exchange = instrument
+        return (symbol.upper(), screener.lower(), exchange.upper())
+
+    def record(self, instrument, exists: bool):
+        self.cache.set(self.key(instrument), exists, None if exists else self.negative_ttl)
+
+    async def resolve(self, instruments):
+        """
+        يعيد قاموساً instrument -> True/False لكل أداة أمكن التحقق منها،
+        ويجلب من TradingView فقط الأدوات غير الموجودة في الذاكرة.
+        """
+        results = {}
+        pending = []
+        for instrument in instruments:
+            exists = self.cache.get(self.key(instrument))
+            if exists is None:
+                pending.append(instrument)
+            else:
+                results[instrument] = exists
+        if pending:
+            fetched = await self.fetcher.fetch_instruments(pending)
+            for instrument, values in fetched.items():
+                exists = values is not None
+                self.record(instrument, exists)
+                results[instrument] = exists
+        return results
+
+    async def exists(self, instrument) -> bool:
+        results = await self.resolve([instrument])
+        return results.get(instrument, False)
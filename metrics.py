@@ -0,0 +1,189 @@
+import os
+import time
+import threading
+
+# المدة القصوى (بالثواني) منذ آخر دورة فحص ناجحة قبل اعتبار البوت غير سليم
+HEALTH_MAX_STALENESS = float(os.getenv("HEALTH_MAX_STALENESS", "300"))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+_registry = []
+_collectors = []
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + (list(extra) if extra else [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """
+    قيمة لحظية؛ يمكن ربطها بدالة تُستدعى عند كل قراءة (set_function).
+    """
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._function = None
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def get(self, **labels):
+        if self._function is not None:
+            return self._function()
+        return self._values.get(self._key(labels))
+
+    def _samples(self):
+        if self._function is not None:
+            try:
+                return [f"{self.name} {_format_value(self._function())}"]
+            except Exception:
+                return []
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._values = {}  # key -> [counts..., sum]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[i] += 1
+            entry[-1] += value
+
+    def _samples(self):
+        with self._lock:
+            items = [(key, list(entry)) for key, entry in self._values.items()]
+        lines = []
+        for key, entry in items:
+            for bound, count in zip(self.buckets, entry):
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(entry[-1])}")
+            lines.append(f"{self.name}_count{labels} {entry[-2]}")
+        return lines
+
+
+def add_collector(function):
+    """
+    تسجيل دالة تُستدعى قبل كل قراءة للمقاييس (لتحديث القيم المأخوذة من كائنات أخرى).
+    """
+    _collectors.append(function)
+
+
+def render() -> str:
+    """
+    كل المقاييس بصيغة Prometheus النصية.
+    """
+    for collector in _collectors:
+        try:
+            collector()
+        except Exception:
+            pass
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def health():
+    """
+    يعيد (سليم؟، عمر آخر دورة فحص ناجحة بالثواني أو None).
+    """
+    last = LAST_SUCCESSFUL_CYCLE.get()
+    if last is None:
+        # لم تكتمل أي دورة بعد: نعتبر البوت سليماً خلال فترة السماح منذ التشغيل
+        age = time.time() - STARTED_AT
+        return age <= HEALTH_MAX_STALENESS, None
+    age = time.time() - last
+    return age <= HEALTH_MAX_STALENESS, age
+
+
+STARTED_AT = time.time()
+
+# --------------------
+# المقاييس المستخدمة في البوت
+# --------------------
+CHECK_CYCLE_DURATION = Histogram("bot_check_cycle_duration_seconds", "Duration of one price check cycle.")
+CHECK_CYCLE_INSTRUMENTS = Gauge("bot_check_cycle_instruments", "Instruments fetched in the last price check cycle.")
+LAST_SUCCESSFUL_CYCLE = Gauge("bot_last_successful_cycle_timestamp_seconds", "Unix time of the last successful price check cycle.")
+UPSTREAM_FETCH_DURATION = Histogram(
+    "bot_upstream_fetch_duration_seconds", "Latency of TradingView scanner requests.", ["screener", "exchange"]
+)
+UPSTREAM_REQUESTS = Counter("bot_upstream_requests_total", "TradingView scanner requests.", ["screener", "status"])
+FETCH_ERRORS = Counter("bot_fetch_errors_total", "Instruments that could not be fetched.", ["screener", "exchange"])
+ALERTS = Gauge("bot_alerts", "Active alerts.")
+CONDITION_ALERTS = Gauge("bot_condition_alerts", "Active indicator condition alerts (/when).")
+INSTRUMENTS = Gauge("bot_instruments", "Distinct instruments with active alerts.")
+TRIGGERED_ALERTS = Counter("bot_triggered_alerts_total", "Alerts triggered.")
+NOTIFY_LATENCY = Histogram("bot_trigger_to_notify_seconds", "Time from alert trigger to Telegram message sent.")
+DISPATCHER_BACKLOG = Gauge("bot_dispatcher_backlog", "Notifications waiting to be sent.")
+NOTIFICATIONS = Counter("bot_notifications_total", "Notification send outcomes.", ["status"])
+QUARANTINED_INSTRUMENTS = Gauge("bot_quarantined_instruments", "Instruments quarantined after failing for a long time.")
+OPEN_CIRCUITS = Gauge("bot_open_exchange_circuits", "Exchanges whose circuit breaker is open or half-open.")
+CACHE_LOOKUPS = Counter("bot_cache_lookups_total", "Cache hits and misses.", ["cache", "result"])
@@ -0,0 +1,207 @@
+import os
+import time
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from datetime import timedelta
+
+from telegram.error import RetryAfter, TimedOut, NetworkError, BadRequest, ChatMigrated
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# حدود Telegram: حوالي 30 رسالة في الثانية لكل البوت، ورسالة واحدة في الثانية لكل دردشة
+GLOBAL_MESSAGES_PER_SECOND = float(os.getenv("GLOBAL_MESSAGES_PER_SECOND", "25"))
+PER_CHAT_INTERVAL = float(os.getenv("PER_CHAT_INTERVAL", "1.0"))
+# عدد الرسائل التي تُرسل بالتوازي، وعدد المحاولات عند أخطاء الشبكة
+MAX_CONCURRENT_SENDS = int(os.getenv("MAX_CONCURRENT_SENDS", "10"))
+MAX_SEND_ATTEMPTS = 5
+# الحد الأقصى لطول رسالة Telegram
+MAX_MESSAGE_LENGTH = 4096
+
+
+class Notification:
+    __slots__ = ("text", "enqueued_at", "attempts")
+
+    def __init__(self, text: str, enqueued_at: float):
+        self.text = text
+        self.enqueued_at = enqueued_at
+        self.attempts = 0
+
+
+class NotificationDispatcher:
+    """
+    طابور إرسال التنبيهات: يحترم حدود Telegram العامة ولكل دردشة، ويعيد المحاولة عند RetryAfter،
+    ويدمج التنبيهات المتعددة لنفس الدردشة في رسالة واحدة.
+    """
+
+    def __init__(self, messages_per_second=GLOBAL_MESSAGES_PER_SECOND, per_chat_interval=PER_CHAT_INTERVAL,
+                 max_concurrent_sends=MAX_CONCURRENT_SENDS):
+        self.send_interval = 1.0 / messages_per_second
+        self.per_chat_interval = per_chat_interval
+        self.max_concurrent_sends = max_concurrent_sends
+        self.bot = None
+        self._pending = OrderedDict()  # chat_id -> [Notification, ...]
+        self._next_allowed = {}  # chat_id -> أقرب وقت مسموح فيه بالإرسال لهذه الدردشة
+        self._next_send_at = 0.0
+        self._paused_until = 0.0
+        self._wakeup = asyncio.Event()
+        self._slots = None
+        self._task = None
+        self._in_flight = 0
+        # مقاييس
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.latencies = deque(maxlen=1000)  # زمن الانتظار من الإضافة إلى الإرسال (بالثواني)
+
+    # --------------------
+    # الإضافة والمقاييس
+    # --------------------
+    def enqueue(self, chat_id: int, text: str):
+        self._pending.setdefault(chat_id, []).append(Notification(text, time.monotonic()))
+        self._wakeup.set()
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(items) for items in self._pending.values()) + self._in_flight
+
+    def latency_percentile(self, q: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    # --------------------
+    # التشغيل
+    # --------------------
+    def start(self, bot):
+        self.bot = bot
+        self._slots = asyncio.Semaphore(self.max_concurrent_sends)
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """
+        إيقاف الطابور بعد محاولة إرسال ما تبقى خلال drain_timeout ثانية.
+        """
+        deadline = time.monotonic() + drain_timeout
+        while self.queue_depth and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            chat_id = await self._next_ready_chat()
+            await self._global_slot()
+            notifications = self._pending.pop(chat_id, None)
+            if not notifications:
+                continue
+            text, batch, rest = coalesce(notifications)
+            if rest:
+                self._pending[chat_id] = rest
+                self._pending.move_to_end(chat_id, last=False)
+            now = time.monotonic()
+            if len(self._next_allowed) > 10000:
+                self._next_allowed = {c: t for c, t in self._next_allowed.items() if t > now}
+            self._next_allowed[chat_id] = now + self.per_chat_interval
+            await self._slots.acquire()
+            self._in_flight += len(batch)
+            asyncio.get_running_loop().create_task(self._send(chat_id, text, batch))
+
+    async def _next_ready_chat(self):
+        """
+        أول دردشة في الطابور مسموح بالإرسال لها الآن (الأقدم أولاً).
+        """
+        while True:
+            now = time.monotonic()
+            earliest = None
+            for chat_id in self._pending:
+                allowed_at = self._next_allowed.get(chat_id, 0.0)
+                if allowed_at <= now:
+                    return chat_id
+                earliest = allowed_at if earliest is None else min(earliest, allowed_at)
+            self._wakeup.clear()
+            timeout = None if earliest is None else earliest - now
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _global_slot(self):
+        now = time.monotonic()
+        send_at = max(self._next_send_at, self._paused_until, now)
+        self._next_send_at = send_at + self.send_interval
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+
+    async def _send(self, chat_id, text, batch):
+        try:
+            await self.bot.send_message(chat_id=chat_id, text=text)
+            now = time.monotonic()
+            self.sent += 1
+            self.coalesced += len(batch) - 1
+            metrics.NOTIFICATIONS.inc(status="sent")
+            for notification in batch:
+                self.latencies.append(now - notification.enqueued_at)
+                metrics.NOTIFY_LATENCY.observe(now - notification.enqueued_at)
+        except RetryAfter as e:
+            # Telegram طلب التوقف: إيقاف كل الإرسال مؤقتاً ثم إعادة نفس الرسائل
+            delay = e.retry_after.total_seconds() if isinstance(e.retry_after, timedelta) else float(e.retry_after)
+            self._paused_until = max(self._paused_until, time.monotonic() + delay)
+            logger.warning(f"تجاوز حد الإرسال في Telegram، الانتظار {delay} ثانية قبل إعادة المحاولة")
+            self._requeue(chat_id, batch, count_attempt=False)
+        except (BadRequest, ChatMigrated) as e:
+            # أخطاء دائمة (مثلاً Chat not found): BadRequest يرث من NetworkError، لذلك تُلتقط قبله ولا يُعاد إرسالها
+            self._fail(chat_id, batch, e)
+        except (TimedOut, NetworkError) as e:
+            logger.warning(f"خطأ مؤقت في إرسال تنبيه للدردشة {chat_id}: {e}")
+            self._requeue(chat_id, batch, count_attempt=True)
+        except Exception as e:
+            self._fail(chat_id, batch, e)
+        finally:
+            self._in_flight -= len(batch)
+            self._slots.release()
+
+    def _fail(self, chat_id, batch, error):
+        self.failed += len(batch)
+        metrics.NOTIFICATIONS.inc(len(batch), status="failed")
+        logger.error(f"خطأ في إرسال تنبيه للدردشة {chat_id}: {error}")
+
+    def _requeue(self, chat_id, batch, count_attempt: bool):
+        if count_attempt:
+            for notification in batch:
+                notification.attempts += 1
+            if batch[0].attempts >= MAX_SEND_ATTEMPTS:
+                self.failed += len(batch)
+                metrics.NOTIFICATIONS.inc(len(batch), status="failed")
+                logger.error(f"تم التخلي عن {len(batch)} تنبيه للدردشة {chat_id} بعد {MAX_SEND_ATTEMPTS} محاولات")
+                return
+            # تأخير متزايد قبل المحاولة التالية لهذه الدردشة
+            self._next_allowed[chat_id] = time.monotonic() + 2 ** batch[0].attempts
+        self.retries += 1
+        metrics.NOTIFICATIONS.inc(status="retried")
+        self._pending[chat_id] = batch + self._pending.get(chat_id, [])
+        self._pending.move_to_end(chat_id, last=False)
+        self._wakeup.set()
+
+
+def coalesce(notifications):
+    """
+    دمج أكبر عدد ممكن من التنبيهات في رسالة واحدة لا تتجاوز MAX_MESSAGE_LENGTH.
+    يعيد (النص، التنبيهات المدمجة، التنبيهات المتبقية).
+    """
+    lines = []
+    length = 0
+    count = 0
+    for notification in notifications:
+        extra = len(notification.text) + (1 if lines else 0)
+        if lines and length + extra > MAX_MESSAGE_LENGTH:
+            break
+        lines.append(notification.text[:MAX_MESSAGE_LENGTH])
+        length += extra
+        count += 1
+    return "\n".join(lines), notifications[:count], notifications[count:]
@@ -0,0 +1,227 @@
+import os
+import time
+import logging
+
+from alert_index import PriceIndex
+from circuit_breaker import FailureTracker, ExchangeBreaker
+from conditions import ConditionBook, compile_condition
+from market_data import AsyncFetcher, PRICE_COLUMNS, column
+from scheduler import PollScheduler, REQUESTS_PER_MINUTE
+
+logger = logging.getLogger(__name__)
+
+CHECK_INTERVAL = 29  # فترة إعادة المحاولة بعد فشل جلب أداة (بالثواني)
+# الحد الأقصى للتأخير المتزايد بعد فشل طلبات screener كاملة (خطأ HTTP أو انتهاء المهلة)، بالثواني
+REQUEST_BACKOFF_MAX = float(os.getenv("REQUEST_BACKOFF_MAX", "300"))
+# الشروط لا تعتمد على بعد هدف عن السعر، لذلك تُفحص أدواتها على الأقل بهذه الفترة (بالثواني)
+CONDITION_CHECK_INTERVAL = float(os.getenv("CONDITION_CHECK_INTERVAL", "60"))
+
+# الأوامر التي يمكن إرسالها للمحرك كـ (اسم الأمر، المعاملات...) من عملية أخرى
+COMMANDS = {
+    "add_price_alert",
+    "remove_price_alert",
+    "add_condition_alert",
+    "remove_condition_alert",
+    "load",
+    "set_requests_per_minute",
+}
+
+
+class PriceEngine:
+    """
+    نواة فحص الأسعار: فهرس الأهداف وتنبيهات الشروط وجدولة الفحص وتتبع الفشل لمجموعة من الأدوات.
+    لا تعرف شيئاً عن Telegram: كل دورة تعيد قائمة أحداث يعالجها صاحب اتصال Telegram:
+        ("price", alert_id)                      تنبيه سعر تم تفعيله (وحُذف من الفهرس)
+        ("condition", alert_id)                  تنبيه شرط تحقق (وحُذف من الفهرس)
+        ("quarantined", instrument, alert_ids)   أداة تم عزلها بعد فشل طويل
+        ("cycle", stats)                         ملخص الدورة للمقاييس
+    تعمل في نفس عملية البوت، أو داخل عمليات workers.py (كل عملية تملك جزءاً من الأدوات).
+    """
+
+    def __init__(self, fetcher=None, resolver=None, requests_per_minute=REQUESTS_PER_MINUTE, worker_id=0):
+        self.worker_id = worker_id
+        self.price_index = PriceIndex()
+        self.condition_book = ConditionBook()
+        self.scheduler = PollScheduler(requests_per_minute=requests_per_minute, default_interval=CHECK_INTERVAL)
+        # تأخير متزايد للأدوات التي يفشل جلبها، وقاطع دائرة لكل exchange متوقف
+        self.failures = FailureTracker()
+        self.breaker = ExchangeBreaker()
+        # تأخير متزايد لكل screener يفشل طلبه نفسه؛ الأدوات لا تُحتسب عليها هذه الأخطاء ولا تُعزل بسببها
+        self.request_failures = FailureTracker(base=CHECK_INTERVAL, maximum=REQUEST_BACKOFF_MAX,
+                                               quarantine_after=float("inf"))
+        self.fetcher = fetcher or AsyncFetcher()
+        self.resolver = resolver
+        # هل نجح آخر طلب للـ scanner (طلب واحد على الأقل في آخر دورة فيها أدوات مستحقة)
+        self.upstream_ok = True
+
+    # --------------------
+    # إضافة وحذف التنبيهات
+    # --------------------
+    def add_price_alert(self, instrument, target_price, alert_id):
+        self.price_index.add(instrument, target_price, alert_id)
+        self.scheduler.wake(instrument)
+
+    def remove_price_alert(self, instrument, target_price, alert_id):
+        self.price_index.remove(instrument, target_price, alert_id)
+        self._unwatch_if_empty(instrument)
+
+    def add_condition_alert(self, alert_id, instrument, condition):
+        if isinstance(condition, str):
+            condition = compile_condition(condition)
+        self.condition_book.add(alert_id, instrument, condition, None, None)
+        self.scheduler.wake(instrument)
+
+    def remove_condition_alert(self, alert_id, instrument=None):
+        alert = self.condition_book.remove(alert_id)
+        if alert is not None:
+            self._unwatch_if_empty(alert.instrument)
+
+    def load(self, price_items=(), condition_items=()):
+        """
+        تحميل دفعة من التنبيهات: (instrument, target_price, alert_id) و(alert_id, instrument, condition).
+        """
+        self.price_index.bulk_load(price_items)
+        for alert_id, instrument, condition in condition_items:
+            self.add_condition_alert(alert_id, instrument, condition)
+
+    def set_requests_per_minute(self, requests_per_minute):
+        self.scheduler.requests_per_minute = requests_per_minute
+
+    def apply(self, command):
+        name, *args = command
+        if name not in COMMANDS:
+            raise ValueError(f"أمر غير معروف: {name}")
+        getattr(self, name)(*args)
+
+    def is_watched(self, instrument):
+        return bool(self.price_index.count(instrument) or self.condition_book.count(instrument))
+
+    def _unwatch_if_empty(self, instrument):
+        if not self.is_watched(instrument):
+            self.scheduler.forget(instrument)
+            self.failures.forget(instrument)
+            self.breaker.forget(instrument)
+
+    def instruments(self):
+        return list(dict.fromkeys(self.price_index.instruments() + self.condition_book.instruments()))
+
+    def wake_all(self):
+        for instrument in self.instruments():
+            self.scheduler.wake(instrument)
+
+    # --------------------
+    # دورة الفحص
+    # --------------------
+    async def poll(self):
+        return await self.run_cycle()
+
+    async def run_cycle(self):
+        started = time.perf_counter()
+        events = []
+        watched = self.instruments()
+        # فقط الأدوات التي حان موعد فحصها، وكل أداة تُجلب مرة واحدة مهما كان عدد التنبيهات عليها
+        # أدوات الـ exchanges المتوقفة لا تُطلب (عدا أداة تجربة واحدة) ولا تستهلك من ميزانية الطلبات
+        instruments = self.scheduler.due(watched, admit=self.breaker.filter)
+        stats = {
+            "worker": self.worker_id,
+            "due": len(instruments),
+            "fetched": 0,
+            "fetch_errors": [],
+            "duration": 0.0,
+        }
+        if instruments:
+            # أعمدة مؤشرات الشروط (بكل فتراتها الزمنية) تُطلب مع الأسعار في نفس الطلب
+            columns = PRICE_COLUMNS + self.condition_book.columns(instruments)
+            prices = await self.fetcher.fetch_instruments(instruments, columns)
+            # الأدوات التي نجح طلبها تظهر في prices (حتى لو لم يُعثر عليها)، فالقاموس الفارغ يعني فشل كل الطلبات
+            self.upstream_ok = bool(prices)
+            self._process(instruments, prices, events, stats)
+            stats["duration"] = time.perf_counter() - started
+        stats["instruments"] = len(watched)
+        stats["quarantined"] = self.failures.quarantined_count()
+        stats["open_circuits"] = self.breaker.open_count()
+        stats["upstream_ok"] = self.upstream_ok
+        events.append(("cycle", stats))
+        return events
+
+    def _process(self, instruments, prices, events, stats):
+        snapshots = {}  # instrument -> القيم، للأدوات التي عليها تنبيهات شروط
+        exchange_results = {}  # exchange -> {instrument: هل نجح جلبها} في هذه الدورة
+        request_delays = self._request_delays(instruments, prices)
+        for instrument in instruments:
+            symbol, screener, exchange = instrument
+            values = prices.get(instrument)
+            if not values:
+                stats["fetch_errors"].append((screener, exchange))
+                if instrument not in prices:
+                    # فشل الطلب نفسه (مشكلة مؤقتة في الاتصال): تأخير متزايد للـ screener دون احتسابه على الأداة
+                    self.scheduler.postpone(instrument, request_delays[screener])
+                    continue
+                # الأداة لم تعد موجودة: تأخير متزايد، ثم عزلها بعد فشل طويل متواصل
+                exchange_results.setdefault(exchange, {})[instrument] = False
+                delay, newly_quarantined = self.failures.failure(instrument)
+                self.scheduler.postpone(instrument, delay)
+                if self.failures.failures(instrument) == 1:
+                    # نسجل أول فشل فقط حتى لا تتكرر نفس الرسالة في كل دورة
+                    logger.error(f"خطأ في جلب بيانات {symbol} ({screener}, {exchange})")
+                if newly_quarantined:
+                    logger.warning(f"تم عزل {symbol} ({screener}, {exchange}) بعد فشل متواصل في جلب بياناتها")
+                    alert_ids = list(self.price_index.alert_ids(instrument)) + self.condition_book.alert_ids(instrument)
+                    events.append(("quarantined", instrument, alert_ids))
+                continue
+            stats["fetched"] += 1
+            exchange_results.setdefault(exchange, {})[instrument] = True
+            if self.failures.success(instrument):
+                logger.info(f"عادت بيانات {symbol} ({screener}, {exchange}) بعد العزل، تم استئناف المراقبة")
+            if self.resolver is not None:
+                self.resolver.record(instrument, True)
+            close_price = float(values.get(column("close")) or 0)
+            high_price = float(values.get(column("high")) or 0)
+            low_price = float(values.get(column("low")) or 0)
+            # البحث الثنائي في الفهرس يعيد فقط التنبيهات التي عبر السعر هدفها منذ آخر فحص لهذه الأداة
+            for alert_id in self.price_index.pop_crossed(instrument, close_price, high_price, low_price):
+                events.append(("price", alert_id))
+            if self.price_index.count(instrument):
+                self.scheduler.observe(instrument, close_price, high_price, low_price,
+                                       self.price_index.targets(instrument))
+            if self.condition_book.count(instrument):
+                snapshots[instrument] = values
+                interval = self.scheduler.interval_of(instrument)
+                if not self.price_index.count(instrument) or interval is None or interval > CONDITION_CHECK_INTERVAL:
+                    self.scheduler.postpone(instrument, CONDITION_CHECK_INTERVAL)
+            self._unwatch_if_empty(instrument)
+
+        # كل الشروط تُقيّم معاً على لقطات هذه الدورة
+        for alert_id in self.condition_book.evaluate(snapshots):
+            self.remove_condition_alert(alert_id)
+            events.append(("condition", alert_id))
+
+        for exchange, results in exchange_results.items():
+            state = self.breaker.report(exchange, results)
+            if state:
+                logger.warning(f"حالة قاطع الدائرة للـ exchange {exchange} أصبحت: {state}")
+
+    def _request_delays(self, instruments, prices):
+        """
+        تسجيل نتيجة طلبات كل screener في هذه الدورة؛ يعيد screener -> التأخير قبل إعادة محاولة أدوات طلباته الفاشلة.
+        يُسجَّل أول فشل متواصل وعودة الطلبات فقط، لا كل دورة.
+        """
+        failed = {instrument[1] for instrument in instruments if instrument not in prices}
+        delays = {}
+        for screener in {instrument[1] for instrument in instruments}:
+            previous = self.request_failures.failures(screener)
+            if screener not in failed:
+                if previous:
+                    self.request_failures.success(screener)
+                    logger.info(f"عادت طلبات {screener} للعمل بعد {previous} محاولة فاشلة")
+                continue
+            delays[screener], _ = self.request_failures.failure(screener)
+            if not previous:
+                logger.error(f"فشل طلب بيانات {screener}، ستتم إعادة المحاولة بتأخير متزايد")
+        return delays
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
@@ -0,0 +1,152 @@
+import os
+import time
+from bisect import bisect_left
+
+from market_data import MAX_TICKERS_PER_REQUEST
+
+# الحد الأقصى لطلبات الـ scanner في الدقيقة (لكل عمليات فحص الأسعار)
+REQUESTS_PER_MINUTE = float(os.getenv("REQUESTS_PER_MINUTE", "60"))
+# أقصر وأطول فترة بين فحصين لنفس الأداة (بالثواني)
+MIN_POLL_INTERVAL = float(os.getenv("MIN_POLL_INTERVAL", "5"))
+MAX_POLL_INTERVAL = float(os.getenv("MAX_POLL_INTERVAL", "300"))
+# مدة الشمعة التي تُقاس عليها التقلبات (5 دقائق)
+CANDLE_SECONDS = 300
+# معامل أمان: نفحص قبل الوقت المتوقع لوصول السعر إلى أقرب هدف بفارق كبير.
+# PriceIndex.crossed يلتقط العبور بين فحصين متقاربين، لكن ارتداداً داخل شمعة لم تُفحص بعد آخر ملاحظة قد يضيع،
+# لذلك يبقى هذا المعامل مؤثراً في دقة التنبيهات وليس في تأخرها فقط
+SAFETY_FACTOR = float(os.getenv("SAFETY_FACTOR", "0.25"))
+# وزن آخر قراءة في المتوسط المتحرك للتقلبات
+VOLATILITY_SMOOTHING = 0.3
+
+
+class InstrumentSchedule:
+    __slots__ = ("next_due", "interval", "volatility")
+
+    def __init__(self, next_due: float, interval: float):
+        self.next_due = next_due
+        self.interval = interval
+        self.volatility = None
+
+
+class PollScheduler:
+    """
+    جدولة فحص الأسعار لكل أداة على حدة: فحص أسرع عندما يكون أقرب هدف قريباً من آخر سعر
+    أو عندما تكون الأداة متقلبة، وأبطأ عندما تكون كل الأهداف بعيدة.
+    مجموع الطلبات لا يتجاوز REQUESTS_PER_MINUTE (token bucket)، وتُقدَّم الأدوات الأكثر تأخراً.
+    """
+
+    def __init__(self, requests_per_minute=REQUESTS_PER_MINUTE, min_interval=MIN_POLL_INTERVAL,
+                 max_interval=MAX_POLL_INTERVAL, default_interval=None):
+        self.requests_per_minute = requests_per_minute
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.default_interval = default_interval or min_interval
+        self.tokens = float(requests_per_minute)
+        self._refilled_at = time.monotonic()
+        self._schedules = {}
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._refilled_at)
+        self._refilled_at = now
+        self.tokens = min(float(self.requests_per_minute), self.tokens + elapsed * self.requests_per_minute / 60.0)
+
+    def _schedule(self, instrument, now):
+        schedule = self._schedules.get(instrument)
+        if schedule is None:
+            # الأدوات الجديدة تُفحص فوراً
+            schedule = self._schedules[instrument] = InstrumentSchedule(now, self.default_interval)
+        return schedule
+
+    def due(self, instruments, now=None, admit=None):
+        """
+        الأدوات المستحقة للفحص الآن، مرتبة حسب التأخر، ضمن ما تسمح به ميزانية الطلبات.
+        admit: دالة اختيارية (instruments, now) -> instruments تستبعد أدوات قبل احتساب الميزانية
+        (مثلاً أدوات exchange متوقف).
+        """
+        now = time.monotonic() if now is None else now
+        self._refill(now)
+        overdue = []
+        for instrument in instruments:
+            schedule = self._schedule(instrument, now)
+            if schedule.next_due <= now:
+                overdue.append((schedule.next_due, instrument))
+        overdue.sort(key=lambda item: item[0])
+        candidates = [instrument for _, instrument in overdue]
+        if admit is not None:
+            candidates = admit(candidates, now)
+
+        # كل screener يحتاج طلباً لكل MAX_TICKERS_PER_REQUEST أداة
+        selected = []
+        per_screener = {}
+        requests_used = 0
+        for instrument in candidates:
+            count = per_screener.get(instrument[1], 0)
+            if count % MAX_TICKERS_PER_REQUEST == 0:
+                if requests_used + 1 > self.tokens:
+                    continue
+                requests_used += 1
+            per_screener[instrument[1]] = count + 1
+            selected.append(instrument)
+        self.tokens -= requests_used
+        return selected
+
+    def observe(self, instrument, close: float, high: float, low: float, targets, now=None):
+        """
+        تحديد موعد الفحص التالي بناءً على بعد أقرب هدف عن آخر سعر وعلى تقلب الأداة.
+        targets: الأسعار المستهدفة لهذه الأداة مرتبة تصاعدياً.
+        """
+        now = time.monotonic() if now is None else now
+        schedule = self._schedule(instrument, now)
+        if close and close > 0:
+            candle_range = max(0.0, high - low) / close
+            if schedule.volatility is None:
+                schedule.volatility = candle_range
+            else:
+                schedule.volatility += VOLATILITY_SMOOTHING * (candle_range - schedule.volatility)
+        distance = nearest_distance(targets, close)
+        volatility = schedule.volatility
+        if distance is None or not volatility:
+            interval = self.max_interval
+        else:
+            # حركة السعر تقريباً تتناسب مع الجذر التربيعي للزمن: الزمن المتوقع لقطع المسافة
+            # ≈ مدة الشمعة × (المسافة / التقلب)²
+            interval = SAFETY_FACTOR * CANDLE_SECONDS * (distance / volatility) ** 2
+        schedule.interval = min(self.max_interval, max(self.min_interval, interval))
+        schedule.next_due = now + schedule.interval
+
+    def postpone(self, instrument, delay=None, now=None):
+        """
+        تأجيل الفحص التالي (مثلاً بعد فشل الجلب).
+        """
+        now = time.monotonic() if now is None else now
+        schedule = self._schedule(instrument, now)
+        schedule.next_due = now + (schedule.interval if delay is None else delay)
+
+    def wake(self, instrument, now=None):
+        """
+        فحص الأداة في أقرب دورة (مثلاً عند إضافة تنبيه جديد عليها).
+        """
+        now = time.monotonic() if now is None else now
+        schedule = self._schedule(instrument, now)
+        schedule.next_due = min(schedule.next_due, now)
+
+    def forget(self, instrument):
+        self._schedules.pop(instrument, None)
+
+    def interval_of(self, instrument):
+        schedule = self._schedules.get(instrument)
+        return schedule.interval if schedule is not None else None
+
+    def __len__(self):
+        return len(self._schedules)
+
+
+def nearest_distance(targets, price: float):
+    """
+    المسافة النسبية بين السعر وأقرب هدف (targets مرتبة تصاعدياً)، أو None إذا لا توجد أهداف.
+    """
+    if not targets or not price or price <= 0:
+        return None
+    i = bisect_left(targets, price)
+    distance = min(abs(targets[j] - price) for j in (i - 1, i) if 0 <= j < len(targets))
+    return distance / price
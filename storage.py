@@ -0,0 +1,262 @@
+import os
+import sqlite3
+import logging
+import itertools
+import threading
+
+logger = logging.getLogger(__name__)
+
+# مسار قاعدة البيانات
+DB_PATH = os.getenv("DB_PATH", "bot_state.db")
+# أقصى مدة (بالثواني) تنتظرها الكتابات قبل تنفيذها معاً في معاملة واحدة (group commit)
+FLUSH_INTERVAL = float(os.getenv("DB_FLUSH_INTERVAL", "0.25"))
+# عدد أرقام التنبيهات التي تُحجز دفعة واحدة في القاعدة
+ALERT_ID_BLOCK = 100
+# عدد الرموز في كل معاملة عند إعادة كتابة قائمة الرموز، حتى لا تنتظر الكتابات الأخرى إعادة الكتابة كلها
+SYMBOLS_CHUNK_SIZE = 5000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS alerts (
+    alert_id INTEGER PRIMARY KEY,
+    screener TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    target_price REAL NOT NULL,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS condition_alerts (
+    alert_id INTEGER PRIMARY KEY,
+    screener TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    symbol TEXT NOT NULL,
+    condition TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS referrals (
+    invited_user INTEGER PRIMARY KEY,
+    referrer INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS symbols (
+    symbol TEXT NOT NULL,
+    screener TEXT NOT NULL,
+    exchange TEXT NOT NULL,
+    PRIMARY KEY (symbol, screener, exchange)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+LOAD_BATCH_SIZE = 10000
+
+ALERT_COLUMNS = ("alert_id", "screener", "exchange", "symbol", "target_price", "chat_id", "user_id")
+CONDITION_ALERT_COLUMNS = ("alert_id", "screener", "exchange", "symbol", "condition", "chat_id", "user_id")
+
+
+class Storage:
+    """
+    تخزين دائم للتنبيهات والدعوات وعداد التنبيهات في SQLite (وضع WAL).
+    الكتابات تُجمع في طابور وتُنفّذ كل FLUSH_INTERVAL في معاملة واحدة، فلا تكلف كل كتابة fsync مستقلاً.
+    """
+
+    def __init__(self, path=DB_PATH, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.conn = None
+        self._lock = threading.Lock()  # يحمي الاتصال بالقاعدة
+        # حجز أرقام التنبيهات له اتصال وقفل خاصان، فلا ينتظر (من حلقة الأحداث) حفظ الكتابات أو قراءة القاعدة
+        self._id_conn = None
+        self._id_lock = threading.Lock()
+        self._pending_lock = threading.Lock()  # يحمي طابور الكتابات فقط، حتى لا تنتظر الإضافة انتهاء الحفظ
+        self._pending = []
+        self._wakeup = threading.Event()
+        self._closed = threading.Event()
+        self._flusher = None
+        self._next_alert_id = 1
+        self._alert_id_ceiling = 1
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def open(self):
+        self.conn = self._connect()
+        self.conn.executescript(SCHEMA)
+        self._id_conn = self._connect()
+        # استئناف العداد بعد آخر رقم محجوز، حتى لا تتكرر أرقام سبق عرضها للمستخدمين
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'alert_id_ceiling'").fetchone()
+        ceiling = row[0] if row else 1
+        max_id = self.conn.execute(
+            "SELECT MAX((SELECT COALESCE(MAX(alert_id), 0) FROM alerts), "
+            "(SELECT COALESCE(MAX(alert_id), 0) FROM condition_alerts))"
+        ).fetchone()[0]
+        self._next_alert_id = self._alert_id_ceiling = max(ceiling, max_id + 1)
+        self._flusher = threading.Thread(target=self._flush_loop, name="db-flusher", daemon=True)
+        self._flusher.start()
+
+    # --------------------
+    # القراءة عند بدء التشغيل
+    # --------------------
+    def load_alerts(self):
+        """
+        كل التنبيهات المحفوظة كدفعات (قوائم) من الصفوف بترتيب ALERT_COLUMNS، حتى لا تُحمّل كلها في قائمة واحدة
+        وتُبنى الفهارس في الذاكرة من كل دفعة مرة واحدة (الترتيب يتم لاحقاً عند بناء الفهارس).
+        """
+        with self._lock:
+            cursor = self.conn.execute(f"SELECT {', '.join(ALERT_COLUMNS)} FROM alerts")
+            while True:
+                rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+                if not rows:
+                    break
+                yield rows
+
+    def load_condition_alerts(self):
+        with self._lock:
+            rows = self.conn.execute(f"SELECT {', '.join(CONDITION_ALERT_COLUMNS)} FROM condition_alerts").fetchall()
+        return [dict(zip(CONDITION_ALERT_COLUMNS, row)) for row in rows]
+
+    def load_referrals(self):
+        with self._lock:
+            return self.conn.execute("SELECT invited_user, referrer FROM referrals").fetchall()
+
+    def load_symbols(self):
+        with self._lock:
+            return self.conn.execute("SELECT symbol, screener, exchange FROM symbols").fetchall()
+
+    def replace_symbols(self, rows):
+        """
+        استبدال قائمة الرموز المحلية بالكامل (تُستدعى من خارج حلقة الأحداث).
+        الرموز تُكتب باتصال مستقل في جدول مؤقت على معاملات صغيرة (SYMBOLS_CHUNK_SIZE)، ثم يحل الجدول الجديد
+        محل القديم بإعادة تسمية سريعة، فلا تُحجز القاعدة ولا self._lock طوال إعادة الكتابة.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("DROP TABLE IF EXISTS symbols_staging")
+            conn.execute(
+                "CREATE TABLE symbols_staging (symbol TEXT NOT NULL, screener TEXT NOT NULL, exchange TEXT NOT NULL, "
+                "PRIMARY KEY (symbol, screener, exchange)) WITHOUT ROWID"
+            )
+            rows = iter(rows)
+            while True:
+                chunk = list(itertools.islice(rows, SYMBOLS_CHUNK_SIZE))
+                if not chunk:
+                    break
+                with conn:
+                    conn.executemany(
+                        "INSERT OR IGNORE INTO symbols_staging (symbol, screener, exchange) VALUES (?, ?, ?)", chunk
+                    )
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DROP TABLE symbols")
+                conn.execute("ALTER TABLE symbols_staging RENAME TO symbols")
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        finally:
+            conn.close()
+
+    # --------------------
+    # الكتابة (تُجمّع وتُنفّذ لاحقاً)
+    # --------------------
+    def next_alert_id(self) -> int:
+        """
+        رقم التنبيه التالي. يتم حجز الأرقام في القاعدة على دفعات بكتابة فورية،
+        لذلك لا يمكن أن يتكرر رقم بعد توقف مفاجئ حتى لو لم تُحفظ آخر الكتابات.
+        """
+        with self._id_lock:
+            if self._next_alert_id >= self._alert_id_ceiling:
+                self._alert_id_ceiling = self._next_alert_id + ALERT_ID_BLOCK
+                self._id_conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('alert_id_ceiling', ?) "
+                    "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                    (self._alert_id_ceiling,)
+                )
+            alert_id = self._next_alert_id
+            self._next_alert_id += 1
+            return alert_id
+
+    def insert_alert(self, alert_obj):
+        self._enqueue(
+            f"INSERT OR REPLACE INTO alerts ({', '.join(ALERT_COLUMNS)}) VALUES ({', '.join('?' * len(ALERT_COLUMNS))})",
+            tuple(alert_obj[c] for c in ALERT_COLUMNS)
+        )
+
+    def delete_alert(self, alert_id: int):
+        self._enqueue("DELETE FROM alerts WHERE alert_id = ?", (alert_id,))
+
+    def insert_condition_alert(self, alert_obj):
+        self._enqueue(
+            f"INSERT OR REPLACE INTO condition_alerts ({', '.join(CONDITION_ALERT_COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(CONDITION_ALERT_COLUMNS))})",
+            tuple(alert_obj[c] for c in CONDITION_ALERT_COLUMNS)
+        )
+
+    def delete_condition_alert(self, alert_id: int):
+        self._enqueue("DELETE FROM condition_alerts WHERE alert_id = ?", (alert_id,))
+
+    def add_referral(self, invited_user: int, referrer: int):
+        self._enqueue("INSERT OR IGNORE INTO referrals (invited_user, referrer) VALUES (?, ?)", (invited_user, referrer))
+
+    def _enqueue(self, sql, params):
+        with self._pending_lock:
+            self._pending.append((sql, params))
+        self._wakeup.set()
+
+    def flush(self):
+        """
+        تنفيذ كل الكتابات المعلقة في معاملة واحدة.
+        كل عملية داخل SAVEPOINT خاص بها، فالعملية الفاشلة تُلغى وحدها ولا تضيع معها باقي كتابات الدفعة.
+        """
+        with self._lock:
+            with self._pending_lock:
+                pending, self._pending = self._pending, []
+            if not pending or self.conn is None:
+                return
+            failed = 0
+            try:
+                self.conn.execute("BEGIN")
+                for sql, params in pending:
+                    self.conn.execute("SAVEPOINT write")
+                    try:
+                        self.conn.execute(sql, params)
+                    except sqlite3.Error as e:
+                        self.conn.execute("ROLLBACK TO write")
+                        failed += 1
+                        logger.error(f"خطأ في حفظ عملية في قاعدة البيانات ({e}): {sql} {params}")
+                    self.conn.execute("RELEASE write")
+                self.conn.execute("COMMIT")
+            except Exception as e:
+                self.conn.execute("ROLLBACK")
+                logger.error(f"خطأ في حفظ {len(pending)} عملية في قاعدة البيانات: {e}")
+                return
+            if failed:
+                logger.error(f"تم حفظ {len(pending) - failed} عملية وتجاهل {failed} عملية فاشلة")
+
+    def _flush_loop(self):
+        while not self._closed.is_set():
+            self._wakeup.wait()
+            # انتظار قصير لتجميع الكتابات المتلاحقة في معاملة واحدة
+            self._closed.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self):
+        if self.conn is None:
+            return
+        self._closed.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        self.flush()
+        with self._lock:
+            self.conn.close()
+            self.conn = None
+        with self._id_lock:
+            self._id_conn.close()
+            self._id_conn = None
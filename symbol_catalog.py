@@ -0,0 +1,106 @@
+import re
+from bisect import bisect_left
+from difflib import SequenceMatcher
+
+_NON_ALNUM = re.compile(r"[^A-Z0-9]")
+
+# trigrams المتكررة جداً (مثل USD) لا تميّز بين الرموز، ونتجاهلها في البحث التقريبي
+MAX_POSTING = 2000
+
+
+def normalize(text: str) -> str:
+    """
+    توحيد صيغة الرمز للبحث: أحرف كبيرة بدون مسافات أو رموز (مثلاً "eur/usd" -> "EURUSD").
+    """
+    return _NON_ALNUM.sub("", text.upper())
+
+
+def trigrams(text: str):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+class SymbolCatalog:
+    """
+    قائمة محلية بالرموز المتاحة (symbol, screener, exchange) مع فهرسين في الذاكرة:
+    قائمة مرتبة للبحث بالبادئة (bisect)، وفهرس trigrams للبحث التقريبي عند الأخطاء الإملائية.
+    الكائن لا يتغير بعد بنائه؛ التحديث يتم ببناء كائن جديد واستبدال المرجع.
+    """
+
+    def __init__(self, entries=()):
+        self._entries = {}  # الرمز الموحد -> [(symbol, screener, exchange), ...]
+        self._known = set()
+        for symbol, screener, exchange in entries:
+            key = (symbol.upper(), screener.lower(), exchange.upper())
+            if key in self._known:
+                continue
+            self._known.add(key)
+            self._entries.setdefault(normalize(symbol), []).append((symbol.upper(), screener.lower(), exchange.upper()))
+        self._sorted = sorted(self._entries)
+        self._trigrams = {}
+        for name in self._sorted:
+            for gram in trigrams(name):
+                self._trigrams.setdefault(gram, []).append(name)
+
+    def __len__(self):
+        return len(self._known)
+
+    def __contains__(self, instrument):
+        symbol, screener, exchange = instrument
+        return (symbol.upper(), screener.lower(), exchange.upper()) in self._known
+
+    def entries(self):
+        return [entry for name in self._sorted for entry in self._entries[name]]
+
+    def _prefix(self, query, limit):
+        names = []
+        i = bisect_left(self._sorted, query)
+        while i < len(self._sorted) and self._sorted[i].startswith(query) and len(names) < limit:
+            names.append(self._sorted[i])
+            i += 1
+        return names
+
+    def _fuzzy(self, query, limit):
+        grams = trigrams(query)
+        if not grams:
+            return {}
+        postings = [self._trigrams.get(gram, ()) for gram in grams]
+        selective = [names for names in postings if len(names) <= MAX_POSTING]
+        shared = {}
+        for names in selective or postings:
+            for name in names:
+                shared[name] = shared.get(name, 0) + 1
+        # تصفية أولية بتشابه Jaccard بين trigrams الاستعلام والرمز، ثم ترتيب أدق لأفضل المرشحين فقط
+        jaccard = {name: count / (len(grams) + max(1, len(name) - 2) - count) for name, count in shared.items()}
+        shortlist = sorted(jaccard, key=lambda name: -jaccard[name])[:limit * 2]
+        scores = {name: SequenceMatcher(None, query, name).ratio() for name in shortlist}
+        best = sorted(scores.items(), key=lambda item: -item[1])[:limit]
+        return dict((name, score) for name, score in best if score >= 0.5)
+
+    def search(self, query: str, limit: int = 10, screener=None, exchange=None):
+        """
+        أفضل limit نتيجة للاستعلام كـ (symbol, screener, exchange)، مرتبة حسب:
+        التطابق التام ثم البادئة (الأقصر أولاً) ثم التشابه التقريبي،
+        مع تقديم الـ screener والـ exchange اللذين اختارهما المستخدم.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        scored = {}
+        if query in self._entries:
+            scored[query] = 3.0
+        for name in self._prefix(query, limit * 4):
+            scored.setdefault(name, 2.0 - (len(name) - len(query)) / 100.0)
+        if not scored:
+            for name, score in self._fuzzy(query, limit * 4).items():
+                scored.setdefault(name, score)
+
+        ranked = []
+        for name, score in scored.items():
+            for entry in self._entries[name]:
+                bonus = (0.05 if entry[1] == screener else 0) + (0.05 if entry[2] == (exchange or "").upper() else 0)
+                # عند التساوي نقدّم الأزواج المقومة بالدولار (نفس افتراض generate_candidate_symbols)
+                if name.endswith(("USD", "USDT")):
+                    bonus += 0.01
+                ranked.append((score + bonus, entry))
+        ranked.sort(key=lambda item: (-item[0], item[1]))
+        return [entry for _, entry in ranked[:limit]]
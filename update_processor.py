@@ -0,0 +1,54 @@
+import sys
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    معالجة عدة تحديثات في نفس الوقت، مع الحفاظ على ترتيب تحديثات نفس المستخدم.
+    ConversationHandler يعتمد على وصول رسائل المستخدم الواحد بالترتيب، لذلك نستخدم قفلاً لكل مستخدم
+    بينما تُعالج تحديثات المستخدمين المختلفين بالتوازي (حتى max_concurrent_updates).
+    المكان من max_concurrent_updates يُحجز فقط بعد الحصول على قفل المستخدم، فرسائل مستخدم واحد
+    تنتظر معالجاً بطيئاً لا تشغل أماكن باقي المستخدمين.
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        if max_concurrent_updates < 1:
+            raise ValueError("`max_concurrent_updates` must be a positive integer!")
+        # الحد الحقيقي يطبقه self._slots بعد قفل المستخدم، لذلك الـ semaphore الذي يحيط به process_update
+        # (ويُبنى من max_concurrent_updates داخل __init__ الأصلي) يكون بلا حد فعلي
+        self._limit = sys.maxsize
+        super().__init__(sys.maxsize)
+        self._limit = max_concurrent_updates
+        self._slots = asyncio.BoundedSemaphore(max_concurrent_updates)
+        self._locks = {}  # user_id -> [القفل، عدد التحديثات التي تنتظره]
+
+    @property
+    def max_concurrent_updates(self) -> int:
+        return self._limit
+
+    async def do_process_update(self, update, coroutine):
+        user = getattr(update, "effective_user", None)
+        if user is None:
+            async with self._slots:
+                await coroutine
+            return
+        entry = self._locks.get(user.id)
+        if entry is None:
+            entry = self._locks[user.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                async with self._slots:
+                    await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[user.id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
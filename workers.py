@@ -0,0 +1,270 @@
+"""
+توزيع فحص الأسعار على عدة عمليات (PRICE_WORKERS > 1).
+
+كل عملية تشغّل PriceEngine خاصاً بها على جزء من الأدوات يُحدد بـ consistent hashing،
+وترسل الأحداث (تنبيهات مفعّلة، عزل أدوات، ملخص الدورة) عبر طابور واحد إلى العملية الرئيسية
+التي تملك اتصال Telegram وقاعدة البيانات وترسل الإشعارات.
+عند تغيير عدد العمليات (أو توقف إحداها) تنتقل فقط الأدوات التي تغير مالكها.
+"""
+import os
+import queue
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+
+from scheduler import REQUESTS_PER_MINUTE
+
+logger = logging.getLogger(__name__)
+
+# عدد عمليات فحص الأسعار (0 أو 1: الفحص داخل عملية البوت نفسها)
+PRICE_WORKERS = int(os.getenv("PRICE_WORKERS", "0"))
+# عدد النقاط الافتراضية لكل عملية على الحلقة (توزيع أكثر تساوياً)
+RING_REPLICAS = 64
+# كل كم ثانية تبحث العملية عن الأدوات المستحقة للفحص
+WORKER_TICK = 2
+# عدد التنبيهات في كل رسالة عند تحميل أو نقل التنبيهات بين العمليات
+LOAD_CHUNK_SIZE = 10000
+
+
+def instrument_key(instrument) -> str:
+    symbol, screener, exchange = instrument
+    return f"{screener.lower()}:{exchange.upper()}:{symbol.upper()}"
+
+
+class HashRing:
+    """
+    حلقة consistent hashing: كل أداة تتبع أول نقطة على الحلقة بعد قيمة الـ hash الخاصة بها،
+    فإضافة عملية أو حذفها ينقل حوالي 1/N من الأدوات فقط.
+    """
+
+    def __init__(self, nodes=(), replicas=RING_REPLICAS):
+        self.replicas = replicas
+        self._points = []  # [(hash, node)] مرتبة
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+    def add(self, node):
+        for i in range(self.replicas):
+            bisect.insort(self._points, (self._hash(f"{node}#{i}"), node))
+
+    def remove(self, node):
+        self._points = [point for point in self._points if point[1] != node]
+
+    def nodes(self):
+        return sorted({node for _, node in self._points})
+
+    def node_for(self, key: str):
+        if not self._points:
+            return None
+        i = bisect.bisect(self._points, (self._hash(key), ))
+        return self._points[i % len(self._points)][1]
+
+
+def worker_main(worker_id, commands, events, requests_per_minute):
+    """
+    نقطة دخول عملية الفحص: تطبيق الأوامر الواردة ثم تشغيل دورة فحص كل WORKER_TICK.
+    """
+    logging.basicConfig(
+        format=f"%(asctime)s - worker-{worker_id} - %(name)s - %(levelname)s - %(message)s",
+        level=logging.INFO
+    )
+    try:
+        asyncio.run(_worker_loop(worker_id, commands, events, requests_per_minute))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _worker_loop(worker_id, commands, events, requests_per_minute):
+    from price_engine import PriceEngine
+
+    engine = PriceEngine(requests_per_minute=requests_per_minute, worker_id=worker_id)
+    while True:
+        while True:
+            try:
+                command = commands.get_nowait()
+            except queue.Empty:
+                break
+            if command is None:
+                return
+            try:
+                engine.apply(command)
+            except Exception as e:
+                logger.error(f"خطأ في تنفيذ الأمر {command[0]}: {e!r}")
+        try:
+            events.put((worker_id, await engine.run_cycle()))
+        except Exception as e:
+            logger.error(f"خطأ في دورة الفحص: {e!r}")
+        await asyncio.sleep(WORKER_TICK)
+
+
+class WorkerPool:
+    """
+    نفس واجهة PriceEngine (إضافة/حذف التنبيهات و poll) لكن الأدوات موزعة على عمليات منفصلة.
+    source: دالة تعيد (تنبيهات السعر، تنبيهات الشروط) الحالية بنفس صيغة PriceEngine.load،
+    وتُستخدم لإعادة توزيع الأدوات عند تغيير عدد العمليات أو إعادة تشغيل عملية متوقفة.
+    """
+
+    def __init__(self, size, source, requests_per_minute=REQUESTS_PER_MINUTE):
+        self.size = size
+        self.source = source
+        self.requests_per_minute = requests_per_minute
+        self._context = multiprocessing.get_context("spawn")
+        self.events = self._context.Queue()
+        self._workers = {}  # worker_id -> (process, commands)
+        self._ring = HashRing()
+
+    # --------------------
+    # التوجيه إلى العملية المالكة
+    # --------------------
+    def owner(self, instrument):
+        return self._ring.node_for(instrument_key(instrument))
+
+    def _send(self, worker_id, command):
+        self._workers[worker_id][1].put(command)
+
+    def add_price_alert(self, instrument, target_price, alert_id):
+        self._send(self.owner(instrument), ("add_price_alert", instrument, target_price, alert_id))
+
+    def remove_price_alert(self, instrument, target_price, alert_id):
+        self._send(self.owner(instrument), ("remove_price_alert", instrument, target_price, alert_id))
+
+    def add_condition_alert(self, alert_id, instrument, condition):
+        text = condition if isinstance(condition, str) else condition.text
+        self._send(self.owner(instrument), ("add_condition_alert", alert_id, instrument, text))
+
+    def remove_condition_alert(self, alert_id, instrument):
+        self._send(self.owner(instrument), ("remove_condition_alert", alert_id))
+
+    def load(self, price_items=(), condition_items=(), only=None):
+        """
+        إرسال التنبيهات إلى مالكيها على دفعات. only: مجموعة عمليات يقتصر عليها الإرسال.
+        """
+        per_worker = {}
+        owners = {}  # المالك يُحسب مرة واحدة لكل أداة، لا لكل تنبيه
+        for instrument, target_price, alert_id in price_items:
+            worker_id = owners.get(instrument)
+            if worker_id is None:
+                worker_id = owners[instrument] = self.owner(instrument)
+            if only is None or worker_id in only:
+                per_worker.setdefault(worker_id, ([], []))[0].append((instrument, target_price, alert_id))
+        for alert_id, instrument, condition in condition_items:
+            worker_id = self.owner(instrument)
+            if only is None or worker_id in only:
+                text = condition if isinstance(condition, str) else condition.text
+                per_worker.setdefault(worker_id, ([], []))[1].append((alert_id, instrument, text))
+        for worker_id, (prices, conditions) in per_worker.items():
+            for i in range(0, max(len(prices), len(conditions)), LOAD_CHUNK_SIZE):
+                self._send(worker_id, ("load", prices[i:i + LOAD_CHUNK_SIZE], conditions[i:i + LOAD_CHUNK_SIZE]))
+
+    # --------------------
+    # تشغيل العمليات وإعادة التوزيع
+    # --------------------
+    def _spawn(self, worker_id):
+        commands = self._context.Queue()
+        process = self._context.Process(
+            target=worker_main,
+            args=(worker_id, commands, self.events, self.requests_per_minute / max(1, self.size)),
+            name=f"price-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = (process, commands)
+
+    async def start(self):
+        await self.resize(self.size)
+
+    async def resize(self, size):
+        """
+        تغيير عدد العمليات مع نقل الأدوات التي تغير مالكها فقط.
+        التوجيه يتغير فوراً، وانتظار توقف العمليات المزالة يتم خارج حلقة الأحداث.
+        """
+        old_ring = HashRing(self._ring.nodes())
+        stopping = []
+        for worker_id in range(size, max(self._workers, default=-1) + 1):
+            stopping.append(self._detach_worker(worker_id))
+            self._ring.remove(worker_id)
+        for worker_id in range(size):
+            if worker_id not in self._workers:
+                self._spawn(worker_id)
+                self._ring.add(worker_id)
+        self.size = size
+        for worker_id in self._workers:
+            self._send(worker_id, ("set_requests_per_minute", self.requests_per_minute / size))
+
+        price_items, condition_items = self.source()
+        moved_prices, moved_conditions = [], []
+        for instrument, target_price, alert_id in price_items:
+            old, new = old_ring.node_for(instrument_key(instrument)), self.owner(instrument)
+            if old != new:
+                if old in self._workers:
+                    self._send(old, ("remove_price_alert", instrument, target_price, alert_id))
+                moved_prices.append((instrument, target_price, alert_id))
+        for alert_id, instrument, condition in condition_items:
+            old, new = old_ring.node_for(instrument_key(instrument)), self.owner(instrument)
+            if old != new:
+                if old in self._workers:
+                    self._send(old, ("remove_condition_alert", alert_id))
+                moved_conditions.append((alert_id, instrument, condition))
+        self.load(moved_prices, moved_conditions)
+        logger.info(f"عدد عمليات فحص الأسعار: {size} (تم نقل {len(moved_prices) + len(moved_conditions)} تنبيه)")
+        await self._join([process for process in stopping if process is not None])
+
+    def _detach_worker(self, worker_id):
+        """
+        إزالة العملية من التوجيه وإرسال أمر التوقف لها؛ يعيد العملية لانتظار توقفها لاحقاً.
+        """
+        entry = self._workers.pop(worker_id, None)
+        if entry is None:
+            return None
+        process, commands = entry
+        commands.put(None)
+        return process
+
+    async def _join(self, processes):
+        """
+        انتظار توقف العمليات في thread pool (العملية المشغولة تقرأ أمر التوقف بعد انتهاء دورتها الحالية)،
+        ثم إنهاء ما لم يتوقف منها خلال 5 ثوانٍ.
+        """
+        if not processes:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, process.join, 5) for process in processes))
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+
+    def _restart_dead(self):
+        dead = [worker_id for worker_id, (process, _) in self._workers.items() if not process.is_alive()]
+        for worker_id in dead:
+            logger.error(f"توقفت عملية فحص الأسعار رقم {worker_id}، تتم إعادة تشغيلها")
+            del self._workers[worker_id]
+            self._spawn(worker_id)
+        if dead:
+            price_items, condition_items = self.source()
+            self.load(price_items, condition_items, only=set(dead))
+
+    async def poll(self):
+        """
+        الأحداث التي وصلت من كل العمليات منذ آخر استدعاء (لا ينتظر).
+        """
+        self._restart_dead()
+        events = []
+        while True:
+            try:
+                worker_id, worker_events = self.events.get_nowait()
+            except queue.Empty:
+                break
+            if worker_id not in self._workers:
+                # عملية أُزيلت بعد إرسال أحداثها: التنبيهات المفعّلة تبقى، أما ملخص دورتها فلم يعد يمثل أي أداة
+                worker_events = [event for event in worker_events if event[0] != "cycle"]
+            events.extend(worker_events)
+        return events
+
+    async def stop(self):
+        await self._join([self._detach_worker(worker_id) for worker_id in list(self._workers)])